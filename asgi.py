@@ -0,0 +1,281 @@
+"""Веб-приложение (Quart): все маршруты и шаблоны
+
+В production его обслуживает Hypercorn (см. serve.py), для разработки —
+встроенный dev-сервер (python app.py). Обработчики — нативные async-функции:
+все обращения к ИИ внутри воркера идут через один event loop и один
+AsyncOpenAI-клиент, а блокирующая работа с SQLite и python-docx выносится в
+пул потоков.
+"""
+import asyncio
+import logging
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from quart import Quart, render_template, jsonify, request, send_file
+
+import http_compression
+import prefetch
+import services
+from config.config import BLOCKING_THREADS
+from database.sharding import create_database
+
+app = Quart(__name__)
+# Кириллица в ответах без \uXXXX — JSON планов и лекций в несколько раз короче
+app.json.ensure_ascii = False
+db = create_database()
+logging.basicConfig(level=logging.INFO)
+
+@app.before_serving
+async def setup_blocking_executor():
+    # asyncio.to_thread использует пул по умолчанию — ограничиваем его размер настройкой
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=BLOCKING_THREADS, thread_name_prefix='blocking'))
+
+@app.after_request
+async def compress_response(response):
+    if not http_compression.is_compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = await response.get_data()
+    # Сжатие крупной лекции занимает миллисекунды — не держим ими event loop
+    encoded = await asyncio.to_thread(http_compression.encode_body, data, request.accept_encodings)
+    if encoded:
+        encoding, body = encoded
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.route('/')
+async def index():
+    programs = await asyncio.to_thread(db.get_all_programs)
+    return await render_template('index.html', programs=programs)
+
+@app.route('/generate_programs', methods=['POST'])
+async def generate_programs():
+    data = await request.get_json()
+    course_theme = data.get('course_theme', '')
+    keywords = data.get('keywords', [])
+    # Кафедра определяет шард, в котором будут храниться программы (см. DB_SHARDING)
+    department = data.get('department')
+
+    if not course_theme or not keywords:
+        return jsonify({'error': 'Необходимо указать тему курса и ключевые слова'}), 400
+
+    try:
+        logging.info(f"Генерация программ для темы: {course_theme}, ключевые слова: {keywords}")
+        programs_dict = await services.generate_program_names(course_theme, keywords)
+        logging.info(f"Сгенерированные программы: {programs_dict}")
+
+        # Сохраняем программы в базу данных одной транзакцией
+        await asyncio.to_thread(db.save_programs, list(programs_dict.items()), tenant=department)
+
+        return jsonify(programs_dict)
+    except Exception as e:
+        logging.exception('Ошибка при генерации программ:')
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/generate_course_plan/<int:program_id>', methods=['POST'])
+async def generate_course_plan(program_id):
+    program = await asyncio.to_thread(db.get_program_by_id, program_id)
+    if not program:
+        logging.error(f'Программа с id={program_id} не найдена')
+        return jsonify({'error': 'Программа не найдена'}), 404
+
+    # Тело {"themes": [...], "literature": true} — перегенерировать только выбранные темы и/или литературу
+    data = await request.get_json(silent=True) or {}
+    themes = data.get('themes') or []
+    regenerate_literature = bool(data.get('literature'))
+    if (not isinstance(themes, list) or not all(isinstance(theme, str) for theme in themes)
+            or len(set(themes)) != len(themes)):
+        return jsonify({'error': 'themes должен быть списком неповторяющихся названий тем'}), 400
+    try:
+        if themes or regenerate_literature:
+            course_plan = await asyncio.to_thread(db.get_course_plan, program_id)
+            if not course_plan:
+                return jsonify({'error': 'План курса не найден'}), 404
+            unknown = [theme for theme in themes if theme not in course_plan or theme.lower() == 'literature']
+            if unknown:
+                return jsonify({'error': f'Темы не найдены в плане курса: {", ".join(unknown)}'}), 400
+            plan = await services.regenerate_themes(db, program, themes, regenerate_literature)
+            return jsonify(plan)
+
+        # Предзагрузку запускает только лидер генерации: запросы, схлопнувшиеся с
+        # ним в других воркерах, иначе завели бы вторую и отменили бы записи первой
+        sorted_plan = await services.generate_course_plan(
+            db, program, on_saved=lambda plan: prefetch.schedule(db, program, plan))
+        return jsonify(sorted_plan)
+    except Exception as e:
+        logging.exception('Ошибка при генерации плана курса:')
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/get_course_plan/<int:program_id>')
+async def get_course_plan(program_id):
+    plan = await asyncio.to_thread(db.get_course_plan, program_id)
+    if not plan:
+        return jsonify({'error': 'План не найден'}), 404
+    return jsonify(plan)
+
+@app.route('/update_course_plan/<int:program_id>', methods=['POST'])
+async def update_course_plan(program_id):
+    data = await request.get_json()
+    await asyncio.to_thread(db.update_course_plan, program_id, data)
+    return jsonify({'success': True})
+
+# --- Точечные правки и чтение: JSON Patch к плану, теме или лекции вместо пересылки всего плана ---
+
+@app.route('/api/programs/<int:program_id>/plan', methods=['PATCH'])
+async def api_patch_course_plan(program_id):
+    operations = await request.get_json()
+    try:
+        plan = await asyncio.to_thread(services.patch_course_plan, db, program_id, operations)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if plan is None:
+        return jsonify({'error': 'План не найден'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/programs/<int:program_id>/themes/<theme>', methods=['GET', 'PATCH'])
+async def api_theme(program_id, theme):
+    try:
+        if request.method == 'PATCH':
+            operations = await request.get_json()
+            content = await asyncio.to_thread(services.patch_theme, db, program_id, theme, operations)
+        else:
+            content = await asyncio.to_thread(services.get_theme, db, program_id, theme,
+                                              request.args.get('path', ''))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if content is None:
+        return jsonify({'error': 'Тема не найдена'}), 404
+    return jsonify(content)
+
+@app.route('/api/programs/<int:program_id>/lectures')
+async def api_lecture_index(program_id):
+    # Темы, по которым лекция уже есть: фронтенду не нужно запрашивать каждую тему
+    themes = await asyncio.to_thread(db.get_lecture_themes, program_id)
+    return jsonify(themes)
+
+@app.route('/api/programs/<int:program_id>/lectures/<theme>', methods=['GET', 'PATCH'])
+async def api_lecture(program_id, theme):
+    try:
+        if request.method == 'PATCH':
+            operations = await request.get_json()
+            content = await asyncio.to_thread(services.patch_lecture, db, program_id, theme, operations)
+        else:
+            content = await asyncio.to_thread(services.get_lecture_part, db, program_id, theme,
+                                              request.args.get('path', ''))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if content is None:
+        return jsonify({'error': 'Лекция не найдена'}), 404
+    # Открытие всей лекции — то же, что /get_lecture: предзагруженная лекция использована
+    if request.method == 'GET' and not request.args.get('path') and prefetch.enabled():
+        await asyncio.to_thread(db.claim_prefetch, program_id, theme)
+    return jsonify(content)
+
+@app.route('/generate_lecture/<int:program_id>/<theme>', methods=['POST'])
+async def generate_lecture(program_id, theme):
+    course_plan = await asyncio.to_thread(db.get_course_plan, program_id)
+    if not course_plan:
+        logging.error(f'План курса для программы {program_id} не найден')
+        return jsonify({'error': 'План курса не найден'}), 404
+
+    program = await asyncio.to_thread(db.get_program_by_id, program_id)
+    if not program:
+        logging.error(f'Программа с id={program_id} не найдена')
+        return jsonify({'error': 'Программа не найдена'}), 404
+
+    try:
+        # Фильтруем литературу, если она есть
+        if theme.lower() == 'literature':
+            return jsonify({'error': 'Нельзя сгенерировать лекцию по литературе'}), 400
+        if theme not in course_plan:
+            return jsonify({'error': f'Тема {theme} не найдена в плане курса'}), 404
+
+        theme_content = course_plan[theme]
+        if not isinstance(theme_content, dict):
+            logging.error(f'Неверный формат данных темы: {theme_content}')
+            return jsonify({'error': 'Неверный формат данных темы'}), 500
+
+        # Лекция могла быть уже сгенерирована в фоне после создания плана; явная
+        # перегенерация (?regenerate=1) не должна возвращать эту копию
+        if prefetch.enabled():
+            if request.args.get('regenerate'):
+                await asyncio.to_thread(db.discard_prefetch, program_id, theme)
+            else:
+                lecture = await asyncio.to_thread(prefetch.claim, db, program_id, theme)
+                if lecture:
+                    return jsonify(lecture)
+
+        lecture_wrapped = await services.generate_lecture(db, program, course_plan, theme)
+        return jsonify(lecture_wrapped)
+    except Exception as e:
+        logging.exception('Ошибка при генерации лекции:')
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/get_lecture/<int:program_id>/<theme>')
+async def get_lecture(program_id, theme):
+    lecture = await asyncio.to_thread(db.get_lecture, program_id, theme)
+    if not lecture:
+        return jsonify({'error': 'Лекция не найдена'}), 404
+    if prefetch.enabled():
+        await asyncio.to_thread(db.claim_prefetch, program_id, theme)
+    return jsonify(lecture)
+
+@app.route('/cancel_prefetch/<int:program_id>', methods=['POST'])
+async def cancel_prefetch(program_id):
+    prefetch.cancel_running(program_id)
+    await asyncio.to_thread(db.cancel_prefetch, program_id)
+    return jsonify({'success': True})
+
+@app.route('/api/prefetch_stats')
+async def api_prefetch_stats():
+    stats = await asyncio.to_thread(db.get_prefetch_stats)
+    return jsonify(stats)
+
+@app.route('/export_lecture/<int:program_id>/<theme>')
+async def export_lecture(program_id, theme):
+    lecture = await asyncio.to_thread(db.get_lecture, program_id, theme)
+    if not lecture:
+        return jsonify({'error': 'Лекция не найдена'}), 404
+
+    doc_io = await asyncio.to_thread(services.build_lecture_docx, theme, lecture)
+    response = await send_file(
+        doc_io,
+        mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    )
+    response.headers.set('Content-Disposition', 'attachment', **attachment_filename(f'{theme}.docx'))
+    return response
+
+def attachment_filename(filename):
+    """Параметры Content-Disposition для имени файла
+
+    Quart пишет filename= как есть, а в заголовке допустим только ASCII: для
+    кириллицы добавляется filename* по RFC 5987 (как в flask.send_file).
+    """
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return {'filename': simple, 'filename*': f"UTF-8''{quote(filename, safe='!#$&+^`|~')}"}
+    return {'filename': filename}
+
+@app.route('/api/all_programs')
+async def api_all_programs():
+    # Без ?department= возвращаются программы всех кафедр
+    programs = await asyncio.to_thread(db.get_all_programs, request.args.get('department'))
+    return jsonify(programs)
+
+@app.route('/generate_big_lecture/<int:program_id>/<theme>', methods=['POST'])
+async def generate_big_lecture(program_id, theme):
+    program = await asyncio.to_thread(db.get_program_by_id, program_id)
+    if not program:
+        logging.error(f'Программа с id={program_id} не найдена')
+        return jsonify({'error': 'Программа не найдена'}), 404
+    try:
+        lecture_dict = await services.generate_big_lecture(db, program, theme)
+        return jsonify(lecture_dict)
+    except Exception as e:
+        logging.exception('Ошибка при генерации большой лекции:')
+        return jsonify({'error': str(e)}), 500
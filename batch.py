@@ -0,0 +1,309 @@
+"""Пакетная генерация курсов без веб-интерфейса
+
+    python batch.py courses.csv --programs 2 --concurrency 4 --rate 60
+
+Входной файл — CSV (колонки course_theme, keywords, department; ключевые слова
+через ";" или ",") или JSONL (объекты с теми же полями, keywords — строка или
+список). Для каждой строки выполняется тот же конвейер, что и в веб-интерфейсе:
+названия программ -> план курса для первых --programs программ -> лекции по
+темам плана. Результаты пишутся в базу приложения (с учётом DB_SHARDING, кафедра
+строки — тенант); программы и лекции сохраняются пачками.
+
+Все обращения к ИИ проходят через общий ограничитель: не больше --concurrency
+одновременных запросов и не больше --rate запросов в минуту. Выполненные шаги
+записываются в файл контрольных точек (по умолчанию <входной файл>.checkpoint.db),
+поэтому прерванный запуск продолжается с того же места повторной командой.
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import re
+import sys
+import time
+
+import services
+from config.config import BATCH_CONCURRENCY, BATCH_REQUESTS_PER_MINUTE
+from database.checkpoint import Checkpoint
+from database.sharding import create_database
+from generate_ai import AI_LIMITER, TOKEN_USAGE
+
+# Для оценки оставшегося времени: сколько программ возвращает промпт names_programs
+# и сколько тем ожидать в плане, пока не готов ни один план
+PROGRAMS_PER_THEME = 10
+DEFAULT_THEMES_PER_PLAN = 8
+
+class RateLimiter:
+    """Ограничивает число одновременных запросов к ИИ и их частоту (запросов в минуту)"""
+    def __init__(self, concurrency, per_minute=0):
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._interval = 60 / per_minute if per_minute else 0
+        self._next_slot = 0.0
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        if self._interval:
+            # Каждый запрос занимает следующий свободный слот; без await между чтением
+            # и записью _next_slot гонки в одном event loop нет
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+            try:
+                await asyncio.sleep(slot - now)
+            except BaseException:
+                self._semaphore.release()
+                raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+
+class Progress:
+    """Счётчик шагов (запросов к ИИ) с выводом скорости и оценкой оставшегося времени"""
+    def __init__(self, rows, programs_per_row, lectures_per_plan, interval):
+        self.rows = rows
+        self.programs_per_row = programs_per_row
+        # None — все темы плана
+        self.lectures_per_plan = lectures_per_plan
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last_report = 0.0
+        self.generated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.themes_seen = []
+        self.tokens = []
+
+    def expected_total(self):
+        themes = (sum(self.themes_seen) / len(self.themes_seen)) if self.themes_seen else DEFAULT_THEMES_PER_PLAN
+        if self.lectures_per_plan is not None:
+            themes = min(themes, self.lectures_per_plan)
+        return round(self.rows * (1 + self.programs_per_row * (1 + themes)))
+
+    def step(self, skipped=False, failed=False):
+        if failed:
+            self.failed += 1
+        elif skipped:
+            self.skipped += 1
+        else:
+            self.generated += 1
+        if time.monotonic() - self.last_report >= self.interval:
+            self.report()
+
+    def report(self, final=False):
+        self.last_report = time.monotonic()
+        elapsed = self.last_report - self.started
+        done = self.generated + self.skipped + self.failed
+        total = max(self.expected_total(), done)
+        per_minute = self.generated / elapsed * 60 if elapsed else 0
+        remaining = total - done
+        if final:
+            eta = "готово"
+        elif per_minute:
+            eta = f"осталось ~{format_duration(remaining / per_minute * 60)}"
+        else:
+            eta = "оценка времени появится после первых шагов"
+        print(f"[{done}/{'' if final else '~'}{total}] {done / total:.0%} | {per_minute:.1f} шаг/мин | "
+              f"сгенерировано {self.generated}, пропущено {self.skipped}, ошибок {self.failed} | "
+              f"токенов {sum(self.tokens)} | {format_duration(elapsed)} | {eta}", flush=True)
+
+class LectureWriter:
+    """Копит сгенерированные лекции и сохраняет их в базу пачками вместе с контрольными точками"""
+    def __init__(self, db, checkpoint, batch_size):
+        self.db = db
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self._lectures = []
+        self._keys = []
+        self._lock = asyncio.Lock()
+
+    async def add(self, lecture, key):
+        self._lectures.append(lecture)
+        self._keys.append(key)
+        if len(self._lectures) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            lectures, keys = self._lectures, self._keys
+            self._lectures, self._keys = [], []
+            if not lectures:
+                return
+            await asyncio.to_thread(self.db.save_lectures, lectures)
+            await asyncio.to_thread(self.checkpoint.mark_done_many, keys)
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}ч {seconds % 3600 // 60:02d}м"
+    return f"{seconds // 60}м {seconds % 60:02d}с"
+
+def split_keywords(keywords):
+    if isinstance(keywords, list):
+        return [str(keyword).strip() for keyword in keywords if str(keyword).strip()]
+    return [keyword.strip() for keyword in re.split(r'[;,]', keywords or '') if keyword.strip()]
+
+def read_rows(path):
+    """Строки входного файла: {'course_theme', 'keywords', 'department'}"""
+    rows = []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if path.endswith('.jsonl'):
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            lines = list(csv.reader(f))
+            header = [column.strip() for column in lines[0]] if lines else []
+            if 'course_theme' in header:
+                records = (dict(zip(header, line)) for line in lines[1:])
+            else:
+                # Без заголовка: тема, ключевые слова, кафедра
+                records = (dict(zip(['course_theme', 'keywords', 'department'], line)) for line in lines)
+        for number, record in enumerate(records, 1):
+            course_theme = (record.get('course_theme') or '').strip()
+            keywords = split_keywords(record.get('keywords'))
+            if not course_theme or not keywords:
+                print(f"⚠️ Строка {number} пропущена: нужны тема курса и ключевые слова")
+                continue
+            rows.append({
+                'course_theme': course_theme,
+                'keywords': keywords,
+                'department': (record.get('department') or '').strip() or None,
+            })
+    return rows
+
+def row_key(row):
+    """Ключ строки не зависит от её номера: файл можно дополнять и переупорядочивать между запусками"""
+    payload = json.dumps([row['course_theme'], row['keywords'], row['department']], ensure_ascii=False)
+    return 'names:' + hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+async def run_batch(rows, db, checkpoint, args):
+    done = await asyncio.to_thread(checkpoint.get_done)
+    lectures_per_plan = 0 if args.no_lectures else (args.lectures or None)
+    progress = Progress(len(rows), args.programs or PROGRAMS_PER_THEME, lectures_per_plan, args.progress_interval)
+    writer = LectureWriter(db, checkpoint, args.lecture_batch)
+    # Ограничитель и счётчик токенов наследуются всеми задачами, созданными ниже
+    AI_LIMITER.set(RateLimiter(args.concurrency, args.rate))
+    TOKEN_USAGE.set(progress.tokens)
+    # Строки обрабатываются не все сразу, чтобы курсы доводились до конца по очереди
+    rows_semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def fail(key, description, error):
+        logging.error(f'{description}: {error}')
+        await asyncio.to_thread(checkpoint.mark_failed, key, str(error))
+        progress.step(failed=True)
+
+    async def names_step(row):
+        key = row_key(row)
+        if key in done:
+            progress.step(skipped=True)
+            return done[key]
+        try:
+            programs = await services.generate_program_names(row['course_theme'], row['keywords'])
+            program_ids = await asyncio.to_thread(db.save_programs, list(programs.items()), tenant=row['department'])
+        except Exception as e:
+            await fail(key, f'Названия программ для "{row["course_theme"]}"', e)
+            return []
+        await asyncio.to_thread(checkpoint.mark_done, key, program_ids)
+        progress.step()
+        return program_ids
+
+    async def plan_step(program):
+        key = f'plan:{program["id"]}'
+        if key in done:
+            plan = await asyncio.to_thread(db.get_course_plan, program['id'])
+            if plan:
+                progress.step(skipped=True)
+                return plan
+        try:
+            plan = await services.generate_course_plan(db, program)
+        except Exception as e:
+            await fail(key, f'План курса "{program["title"]}"', e)
+            return None
+        await asyncio.to_thread(checkpoint.mark_done, key)
+        progress.step()
+        return plan
+
+    async def lecture_step(program, plan, theme):
+        key = f'lecture:{program["id"]}:{plan[theme].get("theme_id") or theme}'
+        if key in done:
+            progress.step(skipped=True)
+            return
+        try:
+            lecture = await services.generate_lecture(db, program, plan, theme, save=False)
+        except Exception as e:
+            await fail(key, f'Лекция "{theme}" курса "{program["title"]}"', e)
+            return
+        await writer.add((program['id'], theme, lecture, plan[theme].get('theme_id')), key)
+        progress.step()
+
+    async def process_program(program_id):
+        program = await asyncio.to_thread(db.get_program_by_id, program_id)
+        if not program:
+            return
+        plan = await plan_step(program)
+        if not plan or args.no_lectures:
+            return
+        themes = [theme for theme, content in plan.items()
+                  if theme.lower() != 'literature' and isinstance(content, dict)]
+        progress.themes_seen.append(len(themes))
+        if args.lectures:
+            themes = themes[:args.lectures]
+        await asyncio.gather(*(lecture_step(program, plan, theme) for theme in themes))
+
+    async def process_row(row):
+        async with rows_semaphore:
+            program_ids = await names_step(row)
+            selected = program_ids[:args.programs] if args.programs else program_ids
+            await asyncio.gather(*(process_program(program_id) for program_id in selected))
+
+    async def report_periodically():
+        while True:
+            await asyncio.sleep(args.progress_interval)
+            progress.report()
+            # Не держим готовые лекции в памяти дольше интервала отчёта
+            await writer.flush()
+
+    reporter = asyncio.create_task(report_periodically())
+    try:
+        await asyncio.gather(*(process_row(row) for row in rows))
+    finally:
+        reporter.cancel()
+        await writer.flush()
+    progress.report(final=True)
+    return progress
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная генерация программ, планов и лекций из CSV/JSONL")
+    parser.add_argument("input", help="CSV или JSONL с колонками course_theme, keywords, department")
+    parser.add_argument("--checkpoint", help="файл контрольных точек (по умолчанию <input>.checkpoint.db)")
+    parser.add_argument("--programs", type=int, default=1,
+                        help="для скольких из сгенерированных программ строки строить план и лекции (0 — для всех)")
+    parser.add_argument("--lectures", type=int, default=0, help="лекций на план, по первым темам (0 — по всем темам)")
+    parser.add_argument("--no-lectures", action="store_true", help="только названия программ и планы")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="одновременных запросов к ИИ")
+    parser.add_argument("--rate", type=int, default=BATCH_REQUESTS_PER_MINUTE,
+                        help="запросов к ИИ в минуту (0 — без ограничения)")
+    parser.add_argument("--lecture-batch", type=int, default=20, help="сколько лекций сохранять в базу за раз")
+    parser.add_argument("--progress-interval", type=float, default=5, help="как часто печатать прогресс, секунд")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    rows = read_rows(args.input)
+    if not rows:
+        raise SystemExit(f"В {args.input} нет строк для генерации")
+    checkpoint = Checkpoint(args.checkpoint or f"{args.input}.checkpoint.db")
+    print(f"Строк: {len(rows)}, одновременных запросов: {args.concurrency}, "
+          f"запросов в минуту: {args.rate or 'без ограничения'}, контрольные точки: {checkpoint.db_path}")
+
+    progress = asyncio.run(run_batch(rows, create_database(), checkpoint, args))
+    # Итог по файлу контрольных точек — с учётом шагов, выполненных прошлыми запусками
+    counts = checkpoint.get_counts()
+    print(f"Контрольные точки: выполнено шагов {counts.get('done', 0)}, с ошибкой {counts.get('failed', 0)}")
+    if progress.failed:
+        print(f"⚠️ Шагов с ошибкой: {progress.failed}. Повторный запуск с тем же файлом контрольных точек "
+              f"выполнит только их и оставшиеся шаги.")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Бенчмарк: размер базы и время чтения лекций до и после migrate_compression
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_compression --lectures 300
+
+Строит временную базу в старом формате (json.dumps с \\uXXXX) с лекциями и
+планами на русском языке, собранными из словаря промптов generate_ai.py, и
+прогоняет на ней миграцию.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+
+from database.db import Database
+from database.migrate_compression import migrate, print_stats
+
+def load_vocabulary():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "generate_ai.py")
+    with open(path, encoding="utf-8") as f:
+        return re.findall(r"[А-Яа-яЁё]{3,}", f.read())
+
+def paragraph(words, rng, sentences):
+    text = []
+    for _ in range(sentences):
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(8, 20)))
+        text.append(sentence.capitalize() + ".")
+    return " ".join(text)
+
+def fake_lecture(words, rng):
+    return {
+        "introduction": paragraph(words, rng, 12),
+        "sections": [
+            {"title": paragraph(words, rng, 1), "content": paragraph(words, rng, rng.randint(20, 40))}
+            for _ in range(rng.randint(3, 6))
+        ],
+        "conclusion": paragraph(words, rng, 8),
+        "recommendations": [paragraph(words, rng, 1) for _ in range(4)],
+    }
+
+def fake_plan(words, rng):
+    plan = {
+        f"Тема {i}: {paragraph(words, rng, 1)}": {
+            "short_description": paragraph(words, rng, 2),
+            "key_issues": [paragraph(words, rng, 1) for _ in range(4)],
+            "hours": 6,
+            "control_point": "тест",
+        }
+        for i in range(1, 9)
+    }
+    plan["literature"] = {"modern": [paragraph(words, rng, 1)] * 3, "classic": [paragraph(words, rng, 1)] * 3}
+    return plan
+
+def build_legacy_db(path, lectures, rng):
+    words = load_vocabulary()
+    db = Database(path)
+    with db.get_connection() as conn:
+        programs = max(1, lectures // 5)
+        for program_id in range(1, programs + 1):
+            conn.execute("INSERT INTO programs (id, title, description) VALUES (?, ?, ?)",
+                         (program_id, paragraph(words, rng, 1), paragraph(words, rng, 1)))
+            # Старый формат: json.dumps по умолчанию экранирует кириллицу
+            conn.execute("INSERT INTO course_plans (program_id, plan_data) VALUES (?, ?)",
+                         (program_id, json.dumps(fake_plan(words, rng))))
+        for i in range(lectures):
+            theme = f"Тема {i % 8 + 1}"
+            conn.execute("INSERT INTO lectures (course_plan_id, theme, content) VALUES (?, ?, ?)",
+                         (i % programs + 1, theme, json.dumps({theme: fake_lecture(words, rng)})))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lectures", type=int, default=300, help="число лекций во временной базе")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "legacy.db")
+        build_legacy_db(path, args.lectures, random.Random(0))
+        print_stats(migrate(path))
+
+if __name__ == '__main__':
+    main()
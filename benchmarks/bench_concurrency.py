@@ -0,0 +1,186 @@
+"""Бенчмарк: параллельная генерация лекций — прежний Flask dev-сервер против ASGI (asgi.py)
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.bench_concurrency --requests 64 --latency 1.0
+
+Обращения к ИИ заменяются задержкой --latency секунд с готовым ответом, поэтому
+бенчмарк не тратит токены и измеряет только то, как сервер держит конкурентные
+долгие запросы. Каждый сервер поднимается в отдельном процессе на общей
+временной базе, чтобы генератор нагрузки не делил с ним GIL.
+
+Базовая линия "flask" воспроизводит прежнюю схему app.py: потоковый Werkzeug-
+сервер, в котором каждый запрос запускает тот же конвейер services через
+собственный asyncio.run.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+import services
+from database.db import Database
+
+FAKE_LECTURE = json.dumps({
+    "introduction": "Введение в тему",
+    "sections": [{"title": "Раздел 1", "content": "Содержание раздела"}],
+    "conclusion": "Заключение",
+    "recommendations": ["Рекомендация 1"],
+}, ensure_ascii=False)
+
+def fake_plan(themes):
+    """План с отдельной темой на каждый запрос: одинаковые запросы схлопнулись бы
+    в одну генерацию (singleflight.py), и бенчмарк мерил бы не сервер, а кеш"""
+    return {
+        f"Тема {i}: Модуль {i}": {
+            "short_description": "Описание",
+            "key_issues": ["вопрос 1", "вопрос 2"],
+            "hours": 6,
+            "control_point": "тест",
+        }
+        for i in range(1, themes + 1)
+    }
+
+def install_fake_ai(latency):
+    async def fake_ai_generate(text, mode):
+        await asyncio.sleep(latency)
+        return FAKE_LECTURE
+    services.ai_generate = fake_ai_generate
+
+def seed_database(db_path, themes):
+    """Создаёт программу с планом; возвращает её id и список тем"""
+    db = Database(db_path)
+    program_id = db.save_program("Бенчмарк", "Программа для бенчмарка")
+    plan = fake_plan(themes)
+    db.save_course_plan(program_id, plan)
+    return program_id, list(plan)
+
+def make_flask_app(db):
+    """Синхронное Flask-приложение с маршрутами, которые нужны бенчмарку"""
+    from flask import Flask, jsonify
+
+    flask_app = Flask(__name__)
+
+    @flask_app.route('/api/all_programs')
+    def api_all_programs():
+        return jsonify(db.get_all_programs())
+
+    @flask_app.route('/generate_lecture/<int:program_id>/<theme>', methods=['POST'])
+    def generate_lecture(program_id, theme):
+        program = db.get_program_by_id(program_id)
+        course_plan = db.get_course_plan(program_id)
+        # Как в прежнем app.py: отдельный event loop на каждый запрос
+        return jsonify(asyncio.run(services.generate_lecture(db, program, course_plan, theme)))
+
+    return flask_app
+
+def serve_flask(db, port):
+    from werkzeug.serving import make_server
+
+    make_server("127.0.0.1", port, make_flask_app(db), threaded=True).serve_forever()
+
+def serve_asgi(db, port):
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+    import asgi
+
+    asgi.db = db
+    config = Config()
+    config.bind = [f"127.0.0.1:{port}"]
+    config.loglevel = "WARNING"
+    asyncio.run(serve(asgi.app, config))
+
+SERVERS = {"flask": serve_flask, "asgi": serve_asgi}
+
+async def wait_ready(base_url):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(f"{base_url}/api/all_programs")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"Сервер {base_url} не поднялся")
+
+async def run_load(base_url, program_id, themes, concurrency):
+    total = len(themes)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i, client):
+        nonlocal errors
+        theme = themes[i]
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"{base_url}/generate_lecture/{program_id}/{theme}")
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i, client) for i in range(total)))
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, errors
+
+def report(name, total, elapsed, latencies, errors):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<8} {total:>5} {elapsed:>8.2f}s {total / elapsed:>8.1f} "
+          f"{statistics.median(latencies):>8.2f}s {p95:>8.2f}s {errors:>6}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=64, help="всего запросов /generate_lecture")
+    parser.add_argument("--concurrency", type=int, default=32, help="одновременных запросов")
+    parser.add_argument("--latency", type=float, default=1.0, help="имитируемая задержка ИИ, с")
+    parser.add_argument("--serve", choices=SERVERS, help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        # Дочерний процесс: поднимаем один сервер с подменённым ИИ
+        logging.disable(logging.INFO)
+        install_fake_ai(args.latency)
+        SERVERS[args.serve](Database(args.db), args.port)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        # У каждого сервера своя программа, чтобы ключи генераций не пересекались
+        # с завершёнными генерациями предыдущего сервера
+        programs = {name: seed_database(db_path, args.requests) for name in SERVERS}
+        print(f"{'сервер':<8} {'запр.':>5} {'время':>9} {'rps':>8} {'p50':>9} {'p95':>9} {'ошибки':>6}")
+        for port, name in enumerate(SERVERS, start=18001):
+            server = subprocess.Popen([
+                sys.executable, "-m", "benchmarks.bench_concurrency", "--serve", name,
+                "--port", str(port), "--db", db_path, "--latency", str(args.latency),
+            ])
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                asyncio.run(wait_ready(base_url))
+                program_id, themes = programs[name]
+                elapsed, latencies, errors = asyncio.run(
+                    run_load(base_url, program_id, themes, args.concurrency))
+                report(name, args.requests, elapsed, latencies, errors)
+            finally:
+                server.terminate()
+                server.wait()
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,68 @@
-from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import os
+import threading
 
 load_dotenv()
 
 AI_TOKEN = os.getenv("AI_TOKEN")
 AI_MODEL = os.getenv("AI_MODEL")
 
-AI_CLIENT = AsyncOpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=AI_TOKEN
-)
\ No newline at end of file
+_ai_client = None
+_ai_client_lock = threading.Lock()
+
+def get_ai_client():
+    """Возвращает AsyncOpenAI-клиент процесса, создавая его при первом обращении к ИИ
+
+    Пакет openai импортируется почти секунду, поэтому он не загружается при
+    импорте конфигурации — это ускоряет запуск воркеров и скриптов.
+    """
+    global _ai_client
+    if _ai_client is None:
+        with _ai_client_lock:
+            if _ai_client is None:
+                from openai import AsyncOpenAI
+                _ai_client = AsyncOpenAI(
+                    base_url="https://openrouter.ai/api/v1",
+                    api_key=AI_TOKEN
+                )
+    return _ai_client
+
+# Настройки production-сервера (ASGI, см. serve.py)
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "2"))
+# Размер пула потоков для блокирующих операций (SQLite, python-docx) в каждом воркере
+BLOCKING_THREADS = int(os.getenv("BLOCKING_THREADS", "8"))
+
+# Single-flight: сколько секунд держится аренда генерации без продления
+# (если процесс-лидер упал, другой процесс подхватит генерацию по истечении этого срока)
+SINGLEFLIGHT_LEASE_TTL = float(os.getenv("SINGLEFLIGHT_LEASE_TTL", "60"))
+# Как часто процессы-последователи проверяют готовность результата
+SINGLEFLIGHT_POLL_INTERVAL = float(os.getenv("SINGLEFLIGHT_POLL_INTERVAL", "0.5"))
+
+# Предзагрузка лекций после генерации плана (см. prefetch.py): 0 — выключена,
+# иначе число первых тем плана, лекции по которым генерируются в фоне
+PREFETCH_LECTURES = int(os.getenv("PREFETCH_LECTURES", "0"))
+# Сколько лекций предзагружается одновременно
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+# Бюджет токенов на предзагрузку одного плана (0 — без ограничения)
+PREFETCH_TOKEN_BUDGET = int(os.getenv("PREFETCH_TOKEN_BUDGET", "0"))
+
+# Шардирование хранилища по тенантам (кафедрам), см. database/sharding.py
+DB_SHARDING = os.getenv("DB_SHARDING", "0") == "1"
+# Каталог с файлами шардов и каталожной базой (по умолчанию database/shards)
+SHARDS_DIR = os.getenv("SHARDS_DIR", "")
+# Сколько файлов шардов держать открытыми одновременно
+SHARD_CACHE_SIZE = int(os.getenv("SHARD_CACHE_SIZE", "16"))
+# Тенант для программ, у которых кафедра не указана
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT", "default")
+
+# JSON-поля лекций и планов длиннее этого числа байт хранятся сжатыми (см. database/codec.py)
+COMPRESSION_THRESHOLD = int(os.getenv("COMPRESSION_THRESHOLD", "1024"))
+
+# JSON-ответы длиннее этого числа байт сжимаются gzip/br, если клиент их принимает (см. http_compression.py)
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+
+# Пакетная генерация (batch.py): сколько запросов к ИИ идёт одновременно и сколько в минуту (0 — без ограничения)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_REQUESTS_PER_MINUTE = int(os.getenv("BATCH_REQUESTS_PER_MINUTE", "60"))
@@ -0,0 +1,21 @@
+CREATE TABLE IF NOT EXISTS tenants (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Глобальная нумерация программ: id выдаётся каталогом и сохраняется в шарде тенанта
+CREATE TABLE IF NOT EXISTS program_tenants (
+    program_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tenant_id INTEGER NOT NULL,
+    FOREIGN KEY (tenant_id) REFERENCES tenants(id)
+);
+
+-- Аренды single-flight общие для всех тенантов
+CREATE TABLE IF NOT EXISTS generation_leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    result JSON,
+    expires_at REAL NOT NULL
+);
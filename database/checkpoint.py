@@ -0,0 +1,49 @@
+"""Контрольные точки пакетной генерации (см. batch.py)
+
+Каждый завершённый шаг (названия программ по строке входного файла, план
+программы, лекция по теме) записывается сюда, и при повторном запуске с тем же
+файлом контрольных точек уже выполненные шаги пропускаются.
+"""
+import json
+import os
+from typing import Any, Dict, List
+
+from database.db import Database, DB_DIR
+
+CHECKPOINT_SCHEMA_PATH = os.path.join(DB_DIR, "checkpoint.sql")
+
+class Checkpoint(Database):
+    schema_path = CHECKPOINT_SCHEMA_PATH
+    schema_version = 1
+
+    def get_done(self) -> Dict[str, Any]:
+        """Ключ выполненного шага -> его результат"""
+        with self.get_connection() as conn:
+            return {
+                key: json.loads(result) if result is not None else None
+                for key, result in conn.execute("SELECT key, result FROM batch_steps WHERE status = 'done'")
+            }
+
+    def mark_done(self, key: str, result: Any = None):
+        self.mark_done_many([key], result)
+
+    def mark_done_many(self, keys: List[str], result: Any = None):
+        payload = json.dumps(result) if result is not None else None
+        with self.get_connection() as conn:
+            conn.executemany(
+                """INSERT OR REPLACE INTO batch_steps (key, status, result, error, updated_at)
+                   VALUES (?, 'done', ?, NULL, CURRENT_TIMESTAMP)""",
+                [(key, payload) for key in keys]
+            )
+
+    def mark_failed(self, key: str, error: str):
+        with self.get_connection() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO batch_steps (key, status, error, updated_at)
+                   VALUES (?, 'failed', ?, CURRENT_TIMESTAMP)""",
+                (key, error)
+            )
+
+    def get_counts(self) -> Dict[str, int]:
+        with self.get_connection() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM batch_steps GROUP BY status").fetchall())
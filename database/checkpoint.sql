@@ -0,0 +1,11 @@
+-- Прогресс пакетной генерации (batch.py); отдельная база, чтобы прерванный запуск можно было продолжить
+CREATE TABLE IF NOT EXISTS batch_steps (
+    -- names:<хэш строки входного файла>, plan:<id программы>, lecture:<id программы>:<theme_id>
+    key TEXT PRIMARY KEY,
+    -- done / failed
+    status TEXT NOT NULL,
+    -- Для шага names — id сохранённых программ
+    result JSON,
+    error TEXT,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,131 @@
+"""Формат хранения больших JSON-полей (lectures.content, course_plans.plan_data)
+
+JSON записывается в UTF-8 без экранирования кириллицы (\\uXXXX раздувает текст
+в несколько раз). Значения длиннее COMPRESSION_THRESHOLD байт сжимаются — zstd,
+если установлен пакет zstandard, иначе zlib — с общим словарём, обученным на
+содержимом базы (таблица compression_dicts, см. migrate_compression.py).
+
+Сжатое значение хранится как BLOB:
+    MAGIC (2 байта) | алгоритм (1 байт: b'z' — zlib, b's' — zstd) | id словаря (4 байта, 0 — без словаря) | данные
+Строки (TEXT) — это несжатый JSON, в том числе старые записи с \\uXXXX.
+"""
+import collections
+import json
+import re
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from config.config import COMPRESSION_THRESHOLD
+
+MAGIC = b'\x1fJ'
+HEADER = struct.Struct('>2scI')
+ZLIB = b'z'
+ZSTD = b's'
+# Как алгоритм записывается в compression_dicts.algo
+ALGO_NAMES = {ZLIB: 'zlib', ZSTD: 'zstd'}
+ALGO_CODES = {name: code for code, name in ALGO_NAMES.items()}
+
+DEFAULT_ALGO = ZSTD if zstandard is not None else ZLIB
+
+def dumps(obj):
+    return json.dumps(obj, ensure_ascii=False)
+
+class Codec:
+    """Кодирует/декодирует JSON-поля одной базы с учётом её словарей сжатия"""
+    def __init__(self, dictionaries=None, current_dict_id=0, algo=DEFAULT_ALGO, threshold=COMPRESSION_THRESHOLD,
+                 loader=None):
+        # id словаря -> (алгоритм, байты словаря)
+        self.dictionaries = dict(dictionaries or {})
+        self.current_dict_id = current_dict_id
+        # loader(dict_id) -> (алгоритм, байты): догружает словарь, обученный после создания кодека
+        self.loader = loader
+        self.algo = algo
+        self.threshold = threshold
+        self._zstd_dicts = {}
+
+    def encode(self, obj):
+        text = dumps(obj)
+        raw = text.encode('utf-8')
+        if len(raw) <= self.threshold:
+            return text
+        dict_id = self.current_dict_id
+        algo = self.algo
+        if dict_id:
+            # Словарь обучен под конкретный алгоритм — сжимаем тем же
+            algo = self._dictionary(dict_id)[0]
+        if algo == ZSTD and zstandard is None:
+            algo, dict_id = ZLIB, 0
+        return HEADER.pack(MAGIC, algo, dict_id) + self._compress(algo, dict_id, raw)
+
+    def decode(self, value):
+        if value is None:
+            return None
+        if isinstance(value, bytes) and value[:2] == MAGIC:
+            _, algo, dict_id = HEADER.unpack_from(value)
+            raw = self._decompress(algo, dict_id, value[HEADER.size:])
+            return json.loads(raw.decode('utf-8'))
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return json.loads(value)
+
+    def _compress(self, algo, dict_id, raw):
+        if algo == ZSTD:
+            return zstandard.ZstdCompressor(level=9, dict_data=self._zstd(dict_id)).compress(raw)
+        if dict_id:
+            compressor = zlib.compressobj(level=9, zdict=self._dictionary(dict_id)[1])
+        else:
+            compressor = zlib.compressobj(level=9)
+        return compressor.compress(raw) + compressor.flush()
+
+    def _decompress(self, algo, dict_id, data):
+        if algo == ZSTD:
+            if zstandard is None:
+                raise RuntimeError("Запись сжата zstd, но пакет zstandard не установлен")
+            return zstandard.ZstdDecompressor(dict_data=self._zstd(dict_id)).decompress(data)
+        if dict_id:
+            decompressor = zlib.decompressobj(zdict=self._dictionary(dict_id)[1])
+        else:
+            decompressor = zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+    def _dictionary(self, dict_id):
+        if dict_id not in self.dictionaries:
+            if self.loader is None:
+                raise KeyError(f"Словарь сжатия {dict_id} не найден")
+            self.dictionaries[dict_id] = self.loader(dict_id)
+        return self.dictionaries[dict_id]
+
+    def _zstd(self, dict_id):
+        if not dict_id:
+            return None
+        if dict_id not in self._zstd_dicts:
+            self._zstd_dicts[dict_id] = zstandard.ZstdCompressionDict(self._dictionary(dict_id)[1])
+        return self._zstd_dicts[dict_id]
+
+def train_dictionary(samples, size=32 * 1024, algo=DEFAULT_ALGO):
+    """Обучает словарь сжатия на образцах JSON (bytes)
+
+    Для zstd используется штатное обучение; для zlib словарь (zdict) собирается из
+    самых «выгодных» слов и фрагментов разметки — частые ставятся в конец, где
+    deflate дотягивается до них дешевле.
+    """
+    if algo == ZSTD:
+        return zstandard.train_dictionary(size, samples).as_bytes()
+
+    counter = collections.Counter()
+    for sample in samples:
+        counter.update(word.encode('utf-8') for word in re.findall(r'"[a-z_]+": |\w{4,}', sample.decode('utf-8')))
+    scored = sorted(counter.items(), key=lambda item: item[1] * len(item[0]))
+    chunks = []
+    total = 0
+    for word, count in reversed(scored):
+        if count < 2 or total + len(word) + 1 > size:
+            continue
+        chunks.append(word)
+        total += len(word) + 1
+    return b' '.join(reversed(chunks))
@@ -1,68 +1,250 @@
+import os
 import sqlite3
 import json
+import threading
+import time
 from typing import List, Dict, Any
 
+from database.codec import Codec, ALGO_NAMES, ALGO_CODES
+
+DB_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(DB_DIR, "programs.db")
+SCHEMA_PATH = os.path.join(DB_DIR, "schema.sql")
+
+# Версия схемы (PRAGMA user_version); увеличивается при каждом изменении schema.sql
+SCHEMA_VERSION = 4
+
+# Колонки, добавленные в уже существующие таблицы: CREATE TABLE IF NOT EXISTS их
+# не создаст, поэтому при обновлении старой базы они добавляются через ALTER TABLE
+ADDED_COLUMNS = [
+    ("lectures", "theme_id", "TEXT"),
+]
+
 class Database:
-    def __init__(self, db_path: str = "database/programs.db"):
+    schema_path = SCHEMA_PATH
+    schema_version = SCHEMA_VERSION
+
+    # Базы, схема которых уже проверена в этом процессе
+    _initialized_paths = set()
+    _init_lock = threading.Lock()
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        # Подключение к базе и проверка схемы откладываются до первого запроса
         self.db_path = db_path
-        self.init_db()
+        self._codec = None
 
     def get_connection(self):
+        if self.db_path not in Database._initialized_paths:
+            self.init_db()
+        return self._connect()
+
+    def _connect(self):
         return sqlite3.connect(self.db_path)
 
+    def for_program(self, program_id: int) -> "Database":
+        """База, в которой лежат данные программы (для шардированного хранилища — её шард)"""
+        return self
+
     def init_db(self):
-        with open('database/schema.sql', 'r') as f:
-            schema = f.read()
-        
+        """Применяет schema.sql, если версия схемы в базе устарела; один раз на процесс"""
+        with Database._init_lock:
+            if self.db_path in Database._initialized_paths:
+                return
+            conn = sqlite3.connect(self.db_path)
+            try:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version < self.schema_version:
+                    with open(self.schema_path, 'r', encoding='utf-8') as f:
+                        schema = f.read()
+                    # Колонки добавляются до схемы: её индексы могут на них ссылаться
+                    self._add_columns(conn)
+                    conn.executescript(schema)
+                    conn.execute(f"PRAGMA user_version = {self.schema_version}")
+                    conn.commit()
+            finally:
+                conn.close()
+            Database._initialized_paths.add(self.db_path)
+
+    @staticmethod
+    def _add_columns(conn):
+        for table, column, column_type in ADDED_COLUMNS:
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            # Пустой список — таблицы ещё нет, её создаст schema.sql уже с колонкой
+            if columns and column not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    @property
+    def codec(self) -> Codec:
+        """Кодек JSON-полей лекций и планов с текущим словарём сжатия базы"""
+        if self._codec is None:
+            rows = self._read_compression_dicts("SELECT id, algo, data FROM compression_dicts")
+            dictionaries = {dict_id: (ALGO_CODES[algo], data) for dict_id, algo, data in rows}
+            self._codec = Codec(dictionaries, current_dict_id=max(dictionaries, default=0),
+                                loader=self.get_compression_dictionary)
+        return self._codec
+
+    def get_compression_dictionary(self, dict_id: int) -> tuple:
+        rows = self._read_compression_dicts("SELECT algo, data FROM compression_dicts WHERE id = ?", (dict_id,))
+        if not rows:
+            raise KeyError(f"Словарь сжатия {dict_id} не найден в {self.db_path}")
+        return ALGO_CODES[rows[0][0]], rows[0][1]
+
+    def _read_compression_dicts(self, query: str, params: tuple = ()) -> List[tuple]:
+        # Кодек создаётся и догружает словари в том числе внутри открытой транзакции
+        # вызывающего (patch_course_plan, save_lectures). Общий with-блок постоянного
+        # соединения шарда закоммитил бы её при выходе, поэтому словари читаются
+        # отдельным коротким соединением
+        if self.db_path not in Database._initialized_paths:
+            self.init_db()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+    def save_compression_dictionary(self, algo: bytes, data: bytes) -> int:
+        """Сохраняет новый словарь; новые записи этой базы будут сжиматься им"""
         with self.get_connection() as conn:
-            conn.executescript(schema)
+            cursor = conn.execute(
+                "INSERT INTO compression_dicts (algo, data) VALUES (?, ?)",
+                (ALGO_NAMES[algo], data)
+            )
+            dict_id = cursor.lastrowid
+        self._codec = None
+        return dict_id
 
-    def save_program(self, title: str, description: str) -> int:
+    def save_program(self, title: str, description: str, tenant: str = None, program_id: int = None) -> int:
+        """Сохраняет программу; tenant (кафедра) учитывается только шардированным хранилищем"""
         with self.get_connection() as conn:
             cursor = conn.execute(
-                "INSERT INTO programs (title, description) VALUES (?, ?)",
-                (title, description)
+                "INSERT INTO programs (id, title, description) VALUES (?, ?, ?)",
+                (program_id, title, description)
             )
             return cursor.lastrowid
 
-    def get_all_programs(self) -> List[Dict[str, Any]]:
+    def save_programs(self, programs: List[tuple], tenant: str = None, program_ids: List[int] = None) -> List[int]:
+        """Сохраняет пары (название, описание) одной транзакцией; возвращает id программ"""
+        program_ids = program_ids or [None] * len(programs)
+        with self.get_connection() as conn:
+            return [
+                conn.execute(
+                    "INSERT INTO programs (id, title, description) VALUES (?, ?, ?)",
+                    (program_id, title, description)
+                ).lastrowid
+                for (title, description), program_id in zip(programs, program_ids)
+            ]
+
+    def get_all_programs(self, tenant: str = None) -> List[Dict[str, Any]]:
+        return list(self.iter_programs())
+
+    def iter_programs(self, batch_size: int = 500):
+        """Лениво перебирает программы по возрастанию id, не держа соединение между пачками"""
+        last_id = 0
+        while True:
+            programs = self.get_programs_page(last_id, batch_size)
+            yield from programs
+            if len(programs) < batch_size:
+                return
+            last_id = programs[-1]["id"]
+
+    def get_programs_page(self, after_id: int, limit: int) -> List[Dict[str, Any]]:
+        """Не более limit программ с id больше after_id, по возрастанию id"""
         with self.get_connection() as conn:
-            cursor = conn.execute("SELECT id, title, description FROM programs")
-            return [{"id": row[0], "title": row[1], "description": row[2]} for row in cursor.fetchall()]
+            rows = conn.execute(
+                "SELECT id, title, description FROM programs WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit)
+            ).fetchall()
+        return [{"id": row[0], "title": row[1], "description": row[2]} for row in rows]
 
     def save_course_plan(self, program_id: int, plan_data: Dict[str, Any]) -> int:
         with self.get_connection() as conn:
             cursor = conn.execute(
                 "INSERT INTO course_plans (program_id, plan_data) VALUES (?, ?)",
-                (program_id, json.dumps(plan_data))
+                (program_id, self.codec.encode(plan_data))
             )
             return cursor.lastrowid
 
     def get_course_plan(self, program_id: int) -> Dict[str, Any]:
         with self.get_connection() as conn:
             cursor = conn.execute(
-                "SELECT plan_data FROM course_plans WHERE program_id = ? ORDER BY created_at DESC LIMIT 1",
+                "SELECT plan_data FROM course_plans WHERE program_id = ? ORDER BY created_at DESC, id DESC LIMIT 1",
                 (program_id,)
             )
             row = cursor.fetchone()
-            return json.loads(row[0]) if row else None
+            return self.codec.decode(row[0]) if row else None
 
-    def save_lecture(self, course_plan_id: int, theme: str, content: Dict[str, Any]) -> int:
+    # Лекция привязана к теме плана через theme_id (см. services.assign_theme_ids):
+    # после переименования или перегенерации соседних тем она остаётся при своей
+    # теме, а перегенерированная тема с тем же названием получает новый id и не
+    # подхватывает устаревшую лекцию. Лекции без theme_id (созданные до появления
+    # id) ищутся по названию темы.
+
+    def _plan_theme_ids(self, conn, program_id: int) -> Dict[str, str]:
+        """Название темы -> theme_id для текущего плана программы"""
+        row = conn.execute(
+            "SELECT plan_data FROM course_plans WHERE program_id = ? ORDER BY created_at DESC, id DESC LIMIT 1",
+            (program_id,)
+        ).fetchone()
+        if not row:
+            return {}
+        plan = self.codec.decode(row[0])
+        return {theme: content['theme_id'] for theme, content in plan.items()
+                if isinstance(content, dict) and content.get('theme_id')}
+
+    def _find_lecture(self, conn, course_plan_id: int, theme: str):
+        """(id, content) последней лекции по теме плана или None"""
+        theme_id = self._plan_theme_ids(conn, course_plan_id).get(theme)
+        if theme_id:
+            return conn.execute(
+                """SELECT id, content FROM lectures
+                   WHERE course_plan_id = ? AND (theme_id = ? OR (theme_id IS NULL AND theme = ?))
+                   ORDER BY id DESC LIMIT 1""",
+                (course_plan_id, theme_id, theme)
+            ).fetchone()
+        return conn.execute(
+            "SELECT id, content FROM lectures WHERE course_plan_id = ? AND theme = ? ORDER BY id DESC LIMIT 1",
+            (course_plan_id, theme)
+        ).fetchone()
+
+    def save_lecture(self, course_plan_id: int, theme: str, content: Dict[str, Any], theme_id: str = None) -> int:
+        """Сохраняет лекцию; без theme_id он берётся из текущего плана по названию темы"""
         with self.get_connection() as conn:
+            if theme_id is None:
+                theme_id = self._plan_theme_ids(conn, course_plan_id).get(theme)
             cursor = conn.execute(
-                "INSERT INTO lectures (course_plan_id, theme, content) VALUES (?, ?, ?)",
-                (course_plan_id, theme, json.dumps(content))
+                "INSERT INTO lectures (course_plan_id, theme, theme_id, content) VALUES (?, ?, ?, ?)",
+                (course_plan_id, theme, theme_id, self.codec.encode(content))
             )
             return cursor.lastrowid
 
+    def save_lectures(self, lectures: List[tuple]):
+        """Сохраняет лекции (course_plan_id, тема, содержимое, theme_id) одной транзакцией"""
+        codec = self.codec
+        with self.get_connection() as conn:
+            plan_theme_ids = {}
+            rows = []
+            for course_plan_id, theme, content, theme_id in lectures:
+                if theme_id is None:
+                    if course_plan_id not in plan_theme_ids:
+                        plan_theme_ids[course_plan_id] = self._plan_theme_ids(conn, course_plan_id)
+                    theme_id = plan_theme_ids[course_plan_id].get(theme)
+                rows.append((course_plan_id, theme, theme_id, codec.encode(content)))
+            conn.executemany(
+                "INSERT INTO lectures (course_plan_id, theme, theme_id, content) VALUES (?, ?, ?, ?)", rows
+            )
+
     def get_lecture(self, course_plan_id: int, theme: str) -> Dict[str, Any]:
         with self.get_connection() as conn:
-            cursor = conn.execute(
-                "SELECT content FROM lectures WHERE course_plan_id = ? AND theme = ?",
-                (course_plan_id, theme)
+            row = self._find_lecture(conn, course_plan_id, theme)
+            return self.codec.decode(row[1]) if row else None
+
+    def link_lectures(self, program_id: int, theme_ids: Dict[str, str]):
+        """Привязывает лекции без theme_id к темам плана по названию (после присвоения id старому плану)"""
+        with self.get_connection() as conn:
+            conn.executemany(
+                "UPDATE lectures SET theme_id = ? WHERE course_plan_id = ? AND theme = ? AND theme_id IS NULL",
+                [(theme_id, program_id, theme) for theme, theme_id in theme_ids.items()]
             )
-            row = cursor.fetchone()
-            return json.loads(row[0]) if row else None
 
     def get_program_by_id(self, program_id: int) -> Dict[str, Any]:
         with self.get_connection() as conn:
@@ -77,5 +259,220 @@ class Database:
         with self.get_connection() as conn:
             conn.execute(
                 "UPDATE course_plans SET plan_data = ? WHERE program_id = ?",
-                (json.dumps(plan_data), program_id)
-            ) 
\ No newline at end of file
+                (self.codec.encode(plan_data), program_id)
+            )
+
+    def patch_course_plan(self, program_id: int, apply) -> Dict[str, Any]:
+        """Изменяет текущий план функцией apply(plan) -> новый план; возвращает новый план или None
+
+        Чтение и запись идут в одной транзакции BEGIN IMMEDIATE, поэтому
+        одновременные правки разных тем не затирают друг друга.
+        """
+        codec = self.codec
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, plan_data FROM course_plans WHERE program_id = ? ORDER BY created_at DESC, id DESC LIMIT 1",
+                (program_id,)
+            ).fetchone()
+            if not row:
+                return None
+            plan = apply(codec.decode(row[1]))
+            conn.execute("UPDATE course_plans SET plan_data = ? WHERE id = ?", (codec.encode(plan), row[0]))
+            return plan
+
+    def patch_lecture(self, course_plan_id: int, theme: str, apply) -> Dict[str, Any]:
+        """Изменяет последнюю лекцию по теме функцией apply(lecture) -> новая лекция; см. patch_course_plan"""
+        codec = self.codec
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = self._find_lecture(conn, course_plan_id, theme)
+            if not row:
+                return None
+            lecture = apply(codec.decode(row[1]))
+            conn.execute("UPDATE lectures SET content = ? WHERE id = ?", (codec.encode(lecture), row[0]))
+            return lecture
+
+    def get_lecture_themes(self, course_plan_id: int) -> List[str]:
+        """Темы текущего плана, по которым уже есть лекции (без чтения самих лекций)"""
+        with self.get_connection() as conn:
+            theme_ids = self._plan_theme_ids(conn, course_plan_id)
+            rows = conn.execute(
+                "SELECT DISTINCT theme, theme_id FROM lectures WHERE course_plan_id = ?",
+                (course_plan_id,)
+            ).fetchall()
+        if not theme_ids:
+            return sorted({theme for theme, _ in rows})
+        linked_ids = {theme_id for _, theme_id in rows if theme_id}
+        legacy_themes = {theme for theme, theme_id in rows if not theme_id}
+        return [theme for theme, theme_id in theme_ids.items()
+                if theme_id in linked_ids or theme in legacy_themes]
+
+    # --- Аренды single-flight (см. singleflight.py) ---
+
+    def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        """Пытается занять аренду генерации по ключу
+
+        Истёкшие аренды перехватываются; завершённые тоже — их результат нужен только
+        тем, кто ждал одновременно с лидером, а новый запрос должен генерировать заново.
+        """
+        now = time.time()
+        with self.get_connection() as conn:
+            conn.execute(
+                "DELETE FROM generation_leases WHERE key = ? AND (expires_at < ? OR status = 'done')",
+                (key, now)
+            )
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO generation_leases (key, owner, status, expires_at) VALUES (?, ?, 'running', ?)",
+                (key, owner, now + ttl)
+            )
+            return cursor.rowcount == 1
+
+    def renew_lease(self, key: str, owner: str, ttl: float):
+        with self.get_connection() as conn:
+            conn.execute(
+                "UPDATE generation_leases SET expires_at = ? WHERE key = ? AND owner = ? AND status = 'running'",
+                (time.time() + ttl, key, owner)
+            )
+
+    def complete_lease(self, key: str, owner: str, result: Any, ttl: float):
+        """Публикует результат генерации для ожидающих процессов на ttl секунд"""
+        with self.get_connection() as conn:
+            conn.execute(
+                "UPDATE generation_leases SET status = 'done', result = ?, expires_at = ? WHERE key = ? AND owner = ?",
+                (json.dumps(result), time.time() + ttl, key, owner)
+            )
+
+    def release_lease(self, key: str, owner: str):
+        with self.get_connection() as conn:
+            conn.execute(
+                "DELETE FROM generation_leases WHERE key = ? AND owner = ?",
+                (key, owner)
+            )
+
+    def get_lease(self, key: str) -> Dict[str, Any]:
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                "SELECT owner, status, result, expires_at FROM generation_leases WHERE key = ?",
+                (key,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            return {
+                "owner": row[0],
+                "status": row[1],
+                "result": json.loads(row[2]) if row[2] is not None else None,
+                "expires_at": row[3],
+            }
+
+    # --- Предзагрузка лекций (см. prefetch.py) ---
+
+    def start_prefetch(self, program_id: int, themes: List[str]) -> Dict[str, int]:
+        """Заводит предзагрузку тем программы, завершая предыдущую (её план устарел)
+
+        Returns:
+            dict: Тема -> id записи предзагрузки
+        """
+        with self.get_connection() as conn:
+            conn.execute(
+                "UPDATE prefetched_lectures SET status = 'discarded' WHERE program_id = ? AND status = 'ready'",
+                (program_id,)
+            )
+            conn.execute(
+                "UPDATE prefetched_lectures SET status = 'cancelled' WHERE program_id = ? AND status IN ('pending', 'running')",
+                (program_id,)
+            )
+            ids = {}
+            for theme in themes:
+                cursor = conn.execute(
+                    "INSERT INTO prefetched_lectures (program_id, theme) VALUES (?, ?)",
+                    (program_id, theme)
+                )
+                ids[theme] = cursor.lastrowid
+            return ids
+
+    def cancel_prefetch(self, program_id: int):
+        with self.get_connection() as conn:
+            conn.execute(
+                "UPDATE prefetched_lectures SET status = 'cancelled' WHERE program_id = ? AND status IN ('pending', 'running')",
+                (program_id,)
+            )
+
+    def update_prefetch(self, prefetch_id: int, from_status: str, to_status: str) -> bool:
+        """Переводит предзагрузку из from_status в to_status; False, если статус уже другой"""
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                "UPDATE prefetched_lectures SET status = ? WHERE id = ? AND status = ?",
+                (to_status, prefetch_id, from_status)
+            )
+            return cursor.rowcount > 0
+
+    def add_prefetch_tokens(self, prefetch_id: int, tokens: int):
+        with self.get_connection() as conn:
+            conn.execute(
+                "UPDATE prefetched_lectures SET tokens = tokens + ? WHERE id = ?",
+                (tokens, prefetch_id)
+            )
+
+    def claim_prefetch(self, program_id: int, theme: str) -> str:
+        """Отмечает, что пользователь запросил лекцию темы; возвращает прежний статус предзагрузки
+
+        ready и running становятся used (попадание), pending — skipped (предзагрузка
+        не успела начаться, генерировать её в фоне уже не нужно).
+        """
+        with self.get_connection() as conn:
+            row = conn.execute(
+                "SELECT id, status FROM prefetched_lectures "
+                "WHERE program_id = ? AND theme = ? AND status IN ('pending', 'running', 'ready') "
+                "ORDER BY id DESC LIMIT 1",
+                (program_id, theme)
+            ).fetchone()
+            if not row:
+                return None
+            new_status = 'skipped' if row[1] == 'pending' else 'used'
+            cursor = conn.execute(
+                "UPDATE prefetched_lectures SET status = ? WHERE id = ? AND status = ?",
+                (new_status, row[0], row[1])
+            )
+            return row[1] if cursor.rowcount else None
+
+    def discard_prefetch(self, program_id: int, theme: str):
+        """Отмечает, что пользователь перегенерирует лекцию темы: предзагруженная не пригодилась
+
+        ready и running становятся discarded, pending — skipped.
+        """
+        with self.get_connection() as conn:
+            conn.execute(
+                "UPDATE prefetched_lectures SET status = CASE status WHEN 'pending' THEN 'skipped' ELSE 'discarded' END "
+                "WHERE program_id = ? AND theme = ? AND status IN ('pending', 'running', 'ready')",
+                (program_id, theme)
+            )
+
+    def get_prefetch_totals(self) -> Dict[str, tuple]:
+        """Статус предзагрузки -> (число записей, сумма токенов)"""
+        with self.get_connection() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*), COALESCE(SUM(tokens), 0) FROM prefetched_lectures GROUP BY status"
+            ).fetchall()
+        return {status: (count, tokens) for status, count, tokens in rows}
+
+    def get_prefetch_stats(self) -> Dict[str, Any]:
+        return prefetch_stats_from_totals(self.get_prefetch_totals())
+
+def prefetch_stats_from_totals(totals: Dict[str, tuple]) -> Dict[str, Any]:
+    """Сводка предзагрузки: доля попаданий и расход токенов (см. Database.get_prefetch_totals)"""
+    counts = {status: count for status, (count, _) in totals.items()}
+    tokens = {status: total for status, (_, total) in totals.items()}
+    generated = counts.get('used', 0) + counts.get('ready', 0) + counts.get('discarded', 0)
+    return {
+        "scheduled": sum(counts.values()),
+        "by_status": counts,
+        "hits": counts.get('used', 0),
+        "hit_rate": counts.get('used', 0) / generated if generated else 0.0,
+        "tokens_spent": sum(tokens.values()),
+        # Токены лекций, которые так и не понадобились: план перегенерирован, отмена или ошибка
+        "wasted_tokens": sum(tokens.get(s, 0) for s in ('discarded', 'cancelled', 'failed', 'skipped')),
+        # Токены готовых, но ещё не открытых лекций
+        "unused_tokens": tokens.get('ready', 0),
+    }
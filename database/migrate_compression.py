@@ -0,0 +1,118 @@
+"""Переводит lectures.content и course_plans.plan_data в сжатый формат (см. codec.py)
+
+    python -m database.migrate_compression                       # database/programs.db
+    python -m database.migrate_compression --shards-dir database/shards
+
+Обучает на содержимом базы общий словарь, перезаписывает все записи в новом
+формате (UTF-8 JSON, сжатие выше COMPRESSION_THRESHOLD) и выполняет VACUUM.
+Печатает размер базы и время чтения лекций до и после. Повторный запуск
+обучает новый словарь и пережимает записи им.
+"""
+import argparse
+import glob
+import os
+import random
+import time
+
+from database.codec import DEFAULT_ALGO, dumps, train_dictionary
+from database.db import Database, DEFAULT_DB_PATH
+
+# Таблица, колонка с JSON
+JSON_COLUMNS = [
+    ("lectures", "content"),
+    ("course_plans", "plan_data"),
+]
+
+def measure_reads(db, lecture_ids, repeat=3):
+    """Среднее время чтения и декодирования одной лекции, мс"""
+    if not lecture_ids:
+        return 0.0
+    started = time.perf_counter()
+    with db.get_connection() as conn:
+        for _ in range(repeat):
+            for lecture_id in lecture_ids:
+                row = conn.execute("SELECT content FROM lectures WHERE id = ?", (lecture_id,)).fetchone()
+                db.codec.decode(row[0])
+    return (time.perf_counter() - started) * 1000 / (repeat * len(lecture_ids))
+
+def file_size(path):
+    return os.path.getsize(path)
+
+def migrate(db_path, dict_size=32 * 1024, max_samples=2000, read_samples=200):
+    """Мигрирует одну базу; возвращает словарь с замерами"""
+    db = Database(db_path)
+    with db.get_connection() as conn:
+        conn.execute("VACUUM")
+        lecture_ids = [row[0] for row in conn.execute("SELECT id FROM lectures")]
+    random.seed(0)
+    read_ids = random.sample(lecture_ids, min(read_samples, len(lecture_ids)))
+    stats = {
+        "db": db_path,
+        "size_before": file_size(db_path),
+        "read_ms_before": measure_reads(db, read_ids),
+    }
+
+    # Обучаем словарь на записях в новом текстовом представлении
+    samples = []
+    with db.get_connection() as conn:
+        for table, column in JSON_COLUMNS:
+            for (value,) in conn.execute(f"SELECT {column} FROM {table} ORDER BY RANDOM() LIMIT ?", (max_samples,)):
+                samples.append(dumps(db.codec.decode(value)).encode('utf-8'))
+    try:
+        dictionary = train_dictionary(samples, dict_size) if len(samples) >= 10 else None
+    except Exception as e:
+        # zstd не обучается на слишком малом или однообразном наборе — сжимаем без словаря
+        print(f"⚠️ Словарь не обучен ({e}), записи будут сжаты без словаря")
+        dictionary = None
+    if dictionary:
+        stats["dict_id"] = db.save_compression_dictionary(DEFAULT_ALGO, dictionary)
+        stats["dict_size"] = len(dictionary)
+
+    codec = db.codec
+    for table, column in JSON_COLUMNS:
+        last_id = 0
+        while True:
+            # Пачками, чтобы не держать всю таблицу в памяти и не блокировать базу надолго
+            with db.get_connection() as conn:
+                rows = conn.execute(
+                    f"SELECT id, {column} FROM {table} WHERE id > ? ORDER BY id LIMIT 500", (last_id,)
+                ).fetchall()
+                conn.executemany(
+                    f"UPDATE {table} SET {column} = ? WHERE id = ?",
+                    [(codec.encode(codec.decode(value)), row_id) for row_id, value in rows]
+                )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+    with db.get_connection() as conn:
+        conn.execute("VACUUM")
+
+    stats["size_after"] = file_size(db_path)
+    stats["read_ms_after"] = measure_reads(db, read_ids)
+    return stats
+
+def print_stats(stats):
+    ratio = stats["size_before"] / stats["size_after"] if stats["size_after"] else 0
+    print(f"{stats['db']}: {stats['size_before'] / 1024:.0f} КБ -> {stats['size_after'] / 1024:.0f} КБ "
+          f"(в {ratio:.1f} раза), чтение лекции {stats['read_ms_before']:.3f} мс -> {stats['read_ms_after']:.3f} мс"
+          + (f", словарь {stats['dict_size']} байт" if "dict_size" in stats else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="Сжатие JSON-полей лекций и планов")
+    parser.add_argument("--db", nargs="*", default=None, help="базы для миграции (по умолчанию programs.db)")
+    parser.add_argument("--shards-dir", help="мигрировать все шарды из каталога")
+    parser.add_argument("--dict-size", type=int, default=32 * 1024, help="размер словаря, байт")
+    args = parser.parse_args()
+
+    paths = list(args.db or [])
+    if args.shards_dir:
+        paths += sorted(glob.glob(os.path.join(args.shards_dir, "tenant_*.db")))
+    if not paths:
+        paths = [DEFAULT_DB_PATH]
+    for path in paths:
+        if not os.path.exists(path):
+            raise SystemExit(f"База {path} не найдена")
+        print_stats(migrate(path, args.dict_size))
+
+if __name__ == '__main__':
+    main()
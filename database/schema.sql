@@ -17,7 +17,40 @@ CREATE TABLE IF NOT EXISTS lectures (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     course_plan_id INTEGER NOT NULL,
     theme TEXT NOT NULL,
+    -- Стабильный id темы в плане (theme_id в plan_data); NULL у лекций, созданных до его появления
+    theme_id TEXT,
     content JSON NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (course_plan_id) REFERENCES course_plans(id)
-); 
\ No newline at end of file
+); 
+
+-- Поиск лекции по теме и список тем с лекциями (/api/programs/<id>/lectures)
+CREATE INDEX IF NOT EXISTS idx_lectures_plan_theme ON lectures (course_plan_id, theme);
+CREATE INDEX IF NOT EXISTS idx_lectures_plan_theme_id ON lectures (course_plan_id, theme_id);
+
+CREATE TABLE IF NOT EXISTS generation_leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    result JSON,
+    expires_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS prefetched_lectures (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    program_id INTEGER NOT NULL,
+    theme TEXT NOT NULL,
+    -- pending -> running -> ready -> used; discarded/cancelled/failed/skipped — конечные
+    status TEXT NOT NULL DEFAULT 'pending',
+    tokens INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (program_id) REFERENCES programs(id)
+);
+
+-- Словари сжатия JSON-полей (см. database/codec.py)
+CREATE TABLE IF NOT EXISTS compression_dicts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    algo TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,324 @@
+"""Шардированное хранилище: отдельный SQLite-файл на каждого тенанта (кафедру)
+
+ShardedDatabase повторяет интерфейс Database, поэтому приложение работает с ним
+так же. Небольшая каталожная база (catalog.db) хранит список тенантов, выдаёт
+глобальные id программ и помнит, в каком шарде лежит каждая программа; все
+данные программы (планы, лекции, предзагрузка) живут в файле её тенанта.
+Шарды открываются лениво и держатся в ограниченном LRU-кэше соединений.
+"""
+import heapq
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any
+
+from config.config import DB_SHARDING, SHARDS_DIR, SHARD_CACHE_SIZE, DEFAULT_TENANT
+from database.db import Database, DB_DIR, prefetch_stats_from_totals
+
+DEFAULT_SHARDS_DIR = os.path.join(DB_DIR, "shards")
+CATALOG_SCHEMA_PATH = os.path.join(DB_DIR, "catalog.sql")
+
+def create_database() -> Database:
+    """Хранилище приложения: шардированное, если включено DB_SHARDING, иначе одна база"""
+    if DB_SHARDING:
+        return ShardedDatabase(SHARDS_DIR or DEFAULT_SHARDS_DIR)
+    return Database()
+
+class Catalog(Database):
+    """Каталожная база: тенанты, принадлежность программ и общие аренды генераций"""
+    schema_path = CATALOG_SCHEMA_PATH
+    schema_version = 1
+
+    def get_or_create_tenant(self, name: str) -> int:
+        with self.get_connection() as conn:
+            conn.execute("INSERT OR IGNORE INTO tenants (name) VALUES (?)", (name,))
+            return conn.execute("SELECT id FROM tenants WHERE name = ?", (name,)).fetchone()[0]
+
+    def get_tenant_id(self, name: str) -> int:
+        with self.get_connection() as conn:
+            row = conn.execute("SELECT id FROM tenants WHERE name = ?", (name,)).fetchone()
+            return row[0] if row else None
+
+    def get_tenant_ids(self) -> List[int]:
+        with self.get_connection() as conn:
+            return [row[0] for row in conn.execute("SELECT id FROM tenants ORDER BY id")]
+
+    def allocate_program_id(self, tenant_id: int, program_id: int = None) -> int:
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO program_tenants (program_id, tenant_id) VALUES (?, ?)",
+                (program_id, tenant_id)
+            )
+            return cursor.lastrowid
+
+    def allocate_program_ids(self, tenant_id: int, count: int) -> List[int]:
+        with self.get_connection() as conn:
+            return [
+                conn.execute("INSERT INTO program_tenants (tenant_id) VALUES (?)", (tenant_id,)).lastrowid
+                for _ in range(count)
+            ]
+
+    def release_program_id(self, program_id: int):
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM program_tenants WHERE program_id = ?", (program_id,))
+
+    def release_program_ids(self, program_ids: List[int]):
+        with self.get_connection() as conn:
+            conn.executemany("DELETE FROM program_tenants WHERE program_id = ?", [(i,) for i in program_ids])
+
+    def get_program_tenant_id(self, program_id: int) -> int:
+        with self.get_connection() as conn:
+            row = conn.execute(
+                "SELECT tenant_id FROM program_tenants WHERE program_id = ?", (program_id,)
+            ).fetchone()
+            return row[0] if row else None
+
+class _ShardConnection:
+    """Постоянное соединение шарда
+
+    Ведёт себя в with-блоке как sqlite3.Connection (коммит/откат), но на время
+    блока берёт блокировку — соединение делят потоки воркера. После close()
+    следующий with-блок откроет файл заново.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            return self._conn.__enter__()
+        except BaseException:
+            self._lock.release()
+            raise
+
+    def __exit__(self, *exc_info):
+        try:
+            return self._conn.__exit__(*exc_info)
+        finally:
+            self._lock.release()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class Shard(Database):
+    """База одного тенанта с постоянным соединением"""
+    def __init__(self, db_path: str):
+        super().__init__(db_path)
+        self._connection = _ShardConnection(db_path)
+
+    def _connect(self):
+        return self._connection
+
+    def close(self):
+        self._connection.close()
+
+class ShardedDatabase:
+    def __init__(self, shards_dir: str = DEFAULT_SHARDS_DIR, max_open_shards: int = SHARD_CACHE_SIZE,
+                 default_tenant: str = DEFAULT_TENANT):
+        os.makedirs(shards_dir, exist_ok=True)
+        self.shards_dir = shards_dir
+        self.max_open_shards = max_open_shards
+        self.default_tenant = default_tenant
+        self.catalog = Catalog(os.path.join(shards_dir, "catalog.db"))
+        self._shards = OrderedDict()
+        self._shards_lock = threading.Lock()
+        # Программа не переезжает между тенантами, поэтому её тенант можно кэшировать
+        self._program_tenants = {}
+
+    # --- Маршрутизация ---
+
+    def shard_path(self, tenant_id: int) -> str:
+        return os.path.join(self.shards_dir, f"tenant_{tenant_id}.db")
+
+    def get_shard(self, tenant_id: int) -> Shard:
+        """Открывает шард тенанта; самый давно не использованный закрывается при переполнении"""
+        with self._shards_lock:
+            shard = self._shards.get(tenant_id)
+            if shard is not None:
+                self._shards.move_to_end(tenant_id)
+                return shard
+            shard = Shard(self.shard_path(tenant_id))
+            self._shards[tenant_id] = shard
+            if len(self._shards) > self.max_open_shards:
+                _, evicted = self._shards.popitem(last=False)
+                evicted.close()
+            return shard
+
+    def for_tenant(self, tenant: str = None) -> Shard:
+        return self.get_shard(self.catalog.get_or_create_tenant(tenant or self.default_tenant))
+
+    def program_tenant_id(self, program_id: int) -> int:
+        tenant_id = self._program_tenants.get(program_id)
+        if tenant_id is None:
+            tenant_id = self.catalog.get_program_tenant_id(program_id)
+            if tenant_id is not None:
+                self._program_tenants[program_id] = tenant_id
+        return tenant_id
+
+    def for_program(self, program_id: int) -> Shard:
+        """Шард программы; не держите его дольше одного обращения — берите заново через
+        for_program, иначе вытесненный из кэша шард откроется снова мимо LRU"""
+        tenant_id = self.program_tenant_id(program_id)
+        return self.get_shard(tenant_id) if tenant_id is not None else None
+
+    def iter_shards(self):
+        for tenant_id in self.catalog.get_tenant_ids():
+            yield self.get_shard(tenant_id)
+
+    # --- Программы ---
+
+    def save_program(self, title: str, description: str, tenant: str = None, program_id: int = None) -> int:
+        tenant_id = self.catalog.get_or_create_tenant(tenant or self.default_tenant)
+        program_id = self.catalog.allocate_program_id(tenant_id, program_id)
+        try:
+            self.get_shard(tenant_id).save_program(title, description, program_id=program_id)
+        except Exception:
+            self.catalog.release_program_id(program_id)
+            raise
+        self._program_tenants[program_id] = tenant_id
+        return program_id
+
+    def save_programs(self, programs: List[tuple], tenant: str = None) -> List[int]:
+        tenant_id = self.catalog.get_or_create_tenant(tenant or self.default_tenant)
+        program_ids = self.catalog.allocate_program_ids(tenant_id, len(programs))
+        try:
+            self.get_shard(tenant_id).save_programs(programs, program_ids=program_ids)
+        except Exception:
+            self.catalog.release_program_ids(program_ids)
+            raise
+        for program_id in program_ids:
+            self._program_tenants[program_id] = tenant_id
+        return program_ids
+
+    def get_all_programs(self, tenant: str = None) -> List[Dict[str, Any]]:
+        """Программы тенанта или, если он не указан, всех тенантов (для администраторов)"""
+        if tenant:
+            tenant_id = self.catalog.get_tenant_id(tenant)
+            return self.get_shard(tenant_id).get_all_programs() if tenant_id else []
+        return list(self.iter_programs())
+
+    def iter_programs(self, batch_size: int = 500):
+        """Программы всех шардов по возрастанию id: слияние ленивых итераторов шардов"""
+        return heapq.merge(*(self._iter_tenant_programs(tenant_id, batch_size)
+                             for tenant_id in self.catalog.get_tenant_ids()),
+                           key=lambda program: program["id"])
+
+    def _iter_tenant_programs(self, tenant_id: int, batch_size: int):
+        # Шард берётся из кэша на каждую пачку: итераторы всех тенантов живут до конца
+        # слияния и не должны держать открытыми вытесненные шарды
+        last_id = 0
+        while True:
+            programs = self.get_shard(tenant_id).get_programs_page(last_id, batch_size)
+            yield from programs
+            if len(programs) < batch_size:
+                return
+            last_id = programs[-1]["id"]
+
+    def get_program_by_id(self, program_id: int) -> Dict[str, Any]:
+        shard = self.for_program(program_id)
+        return shard.get_program_by_id(program_id) if shard else None
+
+    # --- Планы и лекции (course_plan_id в лекциях — это id программы) ---
+
+    def save_course_plan(self, program_id: int, plan_data: Dict[str, Any]) -> int:
+        return self._require_shard(program_id).save_course_plan(program_id, plan_data)
+
+    def get_course_plan(self, program_id: int) -> Dict[str, Any]:
+        shard = self.for_program(program_id)
+        return shard.get_course_plan(program_id) if shard else None
+
+    def update_course_plan(self, program_id: int, plan_data: Dict[str, Any]):
+        return self._require_shard(program_id).update_course_plan(program_id, plan_data)
+
+    def save_lecture(self, course_plan_id: int, theme: str, content: Dict[str, Any], theme_id: str = None) -> int:
+        return self._require_shard(course_plan_id).save_lecture(course_plan_id, theme, content, theme_id)
+
+    def save_lectures(self, lectures: List[tuple]):
+        by_tenant = {}
+        for lecture in lectures:
+            by_tenant.setdefault(self._require_tenant_id(lecture[0]), []).append(lecture)
+        for tenant_id, tenant_lectures in by_tenant.items():
+            self.get_shard(tenant_id).save_lectures(tenant_lectures)
+
+    def get_lecture(self, course_plan_id: int, theme: str) -> Dict[str, Any]:
+        shard = self.for_program(course_plan_id)
+        return shard.get_lecture(course_plan_id, theme) if shard else None
+
+    def patch_course_plan(self, program_id: int, apply) -> Dict[str, Any]:
+        shard = self.for_program(program_id)
+        return shard.patch_course_plan(program_id, apply) if shard else None
+
+    def patch_lecture(self, course_plan_id: int, theme: str, apply) -> Dict[str, Any]:
+        shard = self.for_program(course_plan_id)
+        return shard.patch_lecture(course_plan_id, theme, apply) if shard else None
+
+    def link_lectures(self, program_id: int, theme_ids: Dict[str, str]):
+        self._require_shard(program_id).link_lectures(program_id, theme_ids)
+
+    def get_lecture_themes(self, course_plan_id: int) -> List[str]:
+        shard = self.for_program(course_plan_id)
+        return shard.get_lecture_themes(course_plan_id) if shard else []
+
+    # --- Предзагрузка лекций ---
+
+    def start_prefetch(self, program_id: int, themes: List[str]) -> Dict[str, int]:
+        return self._require_shard(program_id).start_prefetch(program_id, themes)
+
+    def cancel_prefetch(self, program_id: int):
+        shard = self.for_program(program_id)
+        if shard:
+            shard.cancel_prefetch(program_id)
+
+    def claim_prefetch(self, program_id: int, theme: str) -> str:
+        shard = self.for_program(program_id)
+        return shard.claim_prefetch(program_id, theme) if shard else None
+
+    def discard_prefetch(self, program_id: int, theme: str):
+        shard = self.for_program(program_id)
+        if shard:
+            shard.discard_prefetch(program_id, theme)
+
+    def get_prefetch_totals(self) -> Dict[str, tuple]:
+        totals = {}
+        for shard in self.iter_shards():
+            for status, (count, tokens) in shard.get_prefetch_totals().items():
+                prev_count, prev_tokens = totals.get(status, (0, 0))
+                totals[status] = (prev_count + count, prev_tokens + tokens)
+        return totals
+
+    def get_prefetch_stats(self) -> Dict[str, Any]:
+        return prefetch_stats_from_totals(self.get_prefetch_totals())
+
+    # --- Аренды single-flight живут в каталоге ---
+
+    def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        return self.catalog.acquire_lease(key, owner, ttl)
+
+    def renew_lease(self, key: str, owner: str, ttl: float):
+        self.catalog.renew_lease(key, owner, ttl)
+
+    def complete_lease(self, key: str, owner: str, result: Any, ttl: float):
+        self.catalog.complete_lease(key, owner, result, ttl)
+
+    def release_lease(self, key: str, owner: str):
+        self.catalog.release_lease(key, owner)
+
+    def get_lease(self, key: str) -> Dict[str, Any]:
+        return self.catalog.get_lease(key)
+
+    def _require_tenant_id(self, program_id: int) -> int:
+        tenant_id = self.program_tenant_id(program_id)
+        if tenant_id is None:
+            raise ValueError(f"Программа с id={program_id} не зарегистрирована в каталоге")
+        return tenant_id
+
+    def _require_shard(self, program_id: int) -> Shard:
+        return self.get_shard(self._require_tenant_id(program_id))
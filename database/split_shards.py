@@ -0,0 +1,119 @@
+"""Разбивает единую базу programs.db на шарды по тенантам (кафедрам)
+
+    python -m database.split_shards --tenant-map departments.csv
+
+departments.csv — строки вида "program_id,кафедра" (заголовок необязателен);
+программы, которых нет в файле, попадают в тенант --default-tenant. id программ,
+планов и лекций сохраняются, поэтому ссылки вида /get_course_plan/<id> остаются
+рабочими после включения DB_SHARDING=1. Исходная база не изменяется.
+"""
+import argparse
+import csv
+import os
+import sqlite3
+from collections import defaultdict
+
+from config.config import DEFAULT_TENANT
+from database.db import DEFAULT_DB_PATH
+from database.sharding import ShardedDatabase, DEFAULT_SHARDS_DIR
+
+# Таблицы данных программ и колонка, по которой строка относится к программе
+PROGRAM_TABLES = [
+    ("programs", "id"),
+    ("course_plans", "program_id"),
+    ("lectures", "course_plan_id"),
+    ("prefetched_lectures", "program_id"),
+]
+# Таблицы, которые копируются в каждый шард целиком: на словари сжатия ссылаются записи
+SHARED_TABLES = ["compression_dicts"]
+
+def read_tenant_map(path):
+    tenant_map = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip().isdigit():
+                continue
+            tenant_map[int(row[0])] = row[1].strip()
+    return tenant_map
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+def common_columns(source, target, table):
+    target_columns = set(table_columns(target, table))
+    return [column for column in table_columns(source, table) if column in target_columns]
+
+def copy_table(source, target, table):
+    columns = common_columns(source, target, table)
+    if not columns:
+        return 0
+    column_list = ", ".join(columns)
+    rows = source.execute(f"SELECT {column_list} FROM {table}").fetchall()
+    target.executemany(
+        f"INSERT INTO {table} ({column_list}) VALUES ({', '.join('?' for _ in columns)})", rows
+    )
+    return len(rows)
+
+def copy_rows(source, target, table, key_column, program_ids):
+    """Копирует строки таблицы, относящиеся к программам, сохраняя id; возвращает число строк"""
+    columns = common_columns(source, target, table)
+    if not columns:
+        return 0
+    column_list = ", ".join(columns)
+    placeholders = ", ".join("?" for _ in columns)
+    copied = 0
+    ids = sorted(program_ids)
+    # Ограничение SQLite на число параметров — выбираем пачками
+    for start in range(0, len(ids), 500):
+        batch = ids[start:start + 500]
+        rows = source.execute(
+            f"SELECT {column_list} FROM {table} WHERE {key_column} IN ({', '.join('?' for _ in batch)})",
+            batch
+        ).fetchall()
+        target.executemany(f"INSERT INTO {table} ({column_list}) VALUES ({placeholders})", rows)
+        copied += len(rows)
+    return copied
+
+def split(source_path, shards_dir, tenant_map, default_tenant):
+    source = sqlite3.connect(f"file:{source_path}?mode=ro", uri=True)
+    sharded = ShardedDatabase(shards_dir, default_tenant=default_tenant)
+    if next(sharded.iter_programs(), None) is not None:
+        raise SystemExit(f"В {shards_dir} уже есть программы — разбиение выполняется в пустой каталог")
+
+    by_tenant = defaultdict(list)
+    for (program_id,) in source.execute("SELECT id FROM programs ORDER BY id"):
+        by_tenant[tenant_map.get(program_id, default_tenant)].append(program_id)
+
+    for tenant, program_ids in by_tenant.items():
+        tenant_id = sharded.catalog.get_or_create_tenant(tenant)
+        shard = sharded.get_shard(tenant_id)
+        counts = {}
+        with shard.get_connection() as target:
+            for table in SHARED_TABLES:
+                copy_table(source, target, table)
+            for table, key_column in PROGRAM_TABLES:
+                counts[table] = copy_rows(source, target, table, key_column, program_ids)
+        with sharded.catalog.get_connection() as conn:
+            conn.executemany(
+                "INSERT INTO program_tenants (program_id, tenant_id) VALUES (?, ?)",
+                [(program_id, tenant_id) for program_id in program_ids]
+            )
+        summary = ", ".join(f"{table}: {count}" for table, count in counts.items())
+        print(f"{tenant} -> {shard.db_path} ({summary})")
+    source.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Разбиение programs.db на шарды по тенантам")
+    parser.add_argument("--source", default=DEFAULT_DB_PATH, help="исходная база")
+    parser.add_argument("--shards-dir", default=DEFAULT_SHARDS_DIR, help="каталог для шардов и catalog.db")
+    parser.add_argument("--tenant-map", help="CSV: program_id,кафедра")
+    parser.add_argument("--default-tenant", default=DEFAULT_TENANT, help="тенант для программ без кафедры")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        raise SystemExit(f"База {args.source} не найдена")
+    tenant_map = read_tenant_map(args.tenant_map) if args.tenant_map else {}
+    split(args.source, args.shards_dir, tenant_map, args.default_tenant)
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,27 @@
-from config.config import AI_CLIENT, AI_MODEL
+from contextvars import ContextVar
+
+from config.config import AI_MODEL, get_ai_client
+
+# Если в контексте установлен список, сюда дописывается расход токенов каждого
+# вызова ИИ (используется предзагрузкой лекций для учёта потраченных токенов)
+TOKEN_USAGE = ContextVar('TOKEN_USAGE', default=None)
+# Если в контексте установлен ограничитель (асинхронный контекстный менеджер), каждый
+# вызов ИИ выполняется внутри него (пакетная генерация ограничивает так параллельность
+# и частоту запросов, см. batch.py)
+AI_LIMITER = ContextVar('AI_LIMITER', default=None)
 
 async def ai_generate(text: str, mode: str) -> str:
+    limiter = AI_LIMITER.get()
+    if limiter is None:
+        return await _ai_generate(text, mode)
+    async with limiter:
+        return await _ai_generate(text, mode)
+
+async def _ai_generate(text: str, mode: str) -> str:
     try:
+        client = get_ai_client()
         if mode == "names_programs":
-            completion = await AI_CLIENT.chat.completions.create(
+            completion = await client.chat.completions.create(
                 model=AI_MODEL,
                 messages=[
                     {
@@ -49,7 +67,7 @@ async def ai_generate(text: str, mode: str) -> str:
                 ]
             )
         elif mode == "generate_full_program":
-            completion = await AI_CLIENT.chat.completions.create(
+            completion = await client.chat.completions.create(
                 model=AI_MODEL,
                 messages=[
                     {
@@ -102,8 +120,61 @@ async def ai_generate(text: str, mode: str) -> str:
                     }
                 ]
             )
+        elif mode == "regenerate_themes":
+            completion = await client.chat.completions.create(
+                model=AI_MODEL,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": f"""
+                            Ты — ведущий специалист в проектировании образовательных программ ВУЗов. Программа курса уже
+                            составлена; преподаватель хочет заменить в ней только отдельные темы{" и список литературы" if text[4] is not None else ""}.
+                            Остальные темы остаются без изменений.
+                            
+                            Название дисциплины: {text[0]}
+                            Описание дисциплины: {text[1]}
+                            Оглавление курса (темы с "regenerate": true нужно заменить): {text[2]}
+                            Текущее содержание заменяемых тем: {text[3]}
+                            {f"Текущий список литературы (заменить): {text[4]}" if text[4] is not None else ""}
+                            
+                            Задача:
+                            1. Для каждой заменяемой темы предложи новую тему на её месте в курсе: она должна логически
+                               продолжать предыдущие темы, подводить к следующим и не повторять остальные темы курса.
+                               Сохрани номер темы в названии ("Тема 3: ...") и примерно тот же объём в часах.
+                            2. Для каждой новой темы укажи "title", "short_description", "key_issues" (3–5 вопросов),
+                               "hours" и "control_point" — как в остальных темах курса.
+                            3. Если нужно заменить литературу — верни блок "literature" со списками "modern" (3–5 источников
+                               2020–2025) и "classic" (3–5 источников до 2020) в формате "Название книги (год)".
+                            
+                            ⚠️ ВАЖНО: Верни результат строго в JSON-формате, без дополнительного текста или форматирования.
+                            Темы — в том же порядке и в том же количестве, что и заменяемые:
+                            {{
+                              "themes": [
+                                {{
+                                  "title": "Тема 3: Название",
+                                  "short_description": "1-2 предложения",
+                                  "key_issues": ["вопрос 1", "вопрос 2", "вопрос 3"],
+                                  "hours": 6,
+                                  "control_point": "тест"
+                                }}
+                              ],
+                              "literature": {{
+                                "modern": ["Книга 1 (2023)", "Книга 2 (2024)"],
+                                "classic": ["Книга 1 (2019)", "Книга 2 (2018)"]
+                              }}
+                            }}
+                            Если литературу заменять не нужно — не включай блок "literature".
+                        """
+                    },
+                    {
+                        # Все данные уже в системном сообщении — не дублируем их, чтобы не тратить токены
+                        "role": "user",
+                        "content": "Замени отмеченные темы курса"
+                    }
+                ]
+            )
         elif mode == "generate_theme_plan":
-            completion = await AI_CLIENT.chat.completions.create(
+            completion = await client.chat.completions.create(
                 model=AI_MODEL,
                 messages=[
                     {
@@ -155,7 +226,7 @@ async def ai_generate(text: str, mode: str) -> str:
                 ]
             )
         elif mode == "generate_theme_lection":
-            completion = await AI_CLIENT.chat.completions.create(
+            completion = await client.chat.completions.create(
                 model=AI_MODEL,
                 messages=[
                     {
@@ -237,7 +308,7 @@ async def ai_generate(text: str, mode: str) -> str:
                 ]
             )
         elif mode == "generate_big_lecture":
-            completion = await AI_CLIENT.chat.completions.create(
+            completion = await client.chat.completions.create(
                 model=AI_MODEL,
                 messages=[
                     {
@@ -273,6 +344,9 @@ async def ai_generate(text: str, mode: str) -> str:
             )
 
         result = completion.choices[0].message.content
+        usage = TOKEN_USAGE.get()
+        if usage is not None and getattr(completion, 'usage', None):
+            usage.append(completion.usage.total_tokens)
         return result
 
     except Exception as e:
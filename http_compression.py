@@ -0,0 +1,44 @@
+"""Сжатие больших JSON-ответов (план курса, лекции), см. asgi.py
+
+Кодировка выбирается по заголовку Accept-Encoding: br, если установлен пакет
+brotli и клиент его принимает, иначе gzip. Ответы короче
+RESPONSE_COMPRESSION_MIN_SIZE байт отдаются как есть — для них сжатие дороже,
+чем экономия трафика.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from config.config import RESPONSE_COMPRESSION_MIN_SIZE
+
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+def is_compressible(response):
+    return (
+        response.mimetype == 'application/json'
+        and 200 <= response.status_code < 300
+        and 'Content-Encoding' not in response.headers
+    )
+
+def choose_encoding(accept_encodings):
+    """Лучшая из поддерживаемых кодировок по Accept-Encoding (werkzeug Accept) или None"""
+    # При равном весе max берёт первую — br предпочтительнее gzip
+    encoding = max(ENCODINGS, key=lambda name: accept_encodings[name])
+    return encoding if accept_encodings[encoding] > 0 else None
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+def encode_body(data, accept_encodings):
+    """(кодировка, сжатое тело) или None, если ответ сжимать не нужно"""
+    if len(data) < RESPONSE_COMPRESSION_MIN_SIZE:
+        return None
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return None
+    return encoding, compress(data, encoding)
@@ -0,0 +1,98 @@
+"""Применение JSON Patch (RFC 6902) к плану курса и лекциям
+
+Фронтенд отправляет только изменённые поля — например,
+[{"op": "replace", "path": "/short_description", "value": "..."}] — вместо
+всего плана. Поддерживаются операции add, remove, replace, move, copy и test;
+пути задаются JSON Pointer (RFC 6901). Ошибки в патче — ValueError.
+"""
+import copy
+
+def parse_pointer(pointer):
+    """Разбирает JSON Pointer ("/a/b~1c") в список ключей (["a", "b/c"])"""
+    if pointer == '':
+        return []
+    if not isinstance(pointer, str) or not pointer.startswith('/'):
+        raise ValueError(f"Неверный путь JSON Pointer: {pointer!r}")
+    return [part.replace('~1', '/').replace('~0', '~') for part in pointer[1:].split('/')]
+
+def _index(container, key, allow_end=False):
+    """Ключ для обращения к элементу: для списков — номер (при allow_end допускается "-")"""
+    if isinstance(container, list):
+        if allow_end and key == '-':
+            return len(container)
+        if not key.isdigit() or (key != '0' and key.startswith('0')):
+            raise ValueError(f"Неверный индекс списка: {key!r}")
+        index = int(key)
+        if index > len(container) or (index == len(container) and not allow_end):
+            raise ValueError(f"Индекс {index} вне списка длиной {len(container)}")
+        return index
+    if isinstance(container, dict):
+        if not allow_end and key not in container:
+            raise ValueError(f"Ключ {key!r} не найден")
+        return key
+    raise ValueError(f"Нельзя обратиться к {key!r}: значение не является объектом или списком")
+
+def _resolve(document, keys):
+    value = document
+    for key in keys:
+        value = value[_index(value, key)]
+    return value
+
+def resolve_pointer(document, pointer):
+    """Значение документа по JSON Pointer"""
+    return _resolve(document, parse_pointer(pointer))
+
+def _parent(document, pointer):
+    """Контейнер, в котором лежит значение по пути, и ключ значения в нём"""
+    keys = parse_pointer(pointer)
+    if not keys:
+        raise ValueError("Операция над корнем документа не поддерживается")
+    return _resolve(document, keys[:-1]), keys[-1]
+
+def _add(document, pointer, value):
+    parent, key = _parent(document, pointer)
+    index = _index(parent, key, allow_end=True)
+    if isinstance(parent, list):
+        parent.insert(index, value)
+    else:
+        parent[index] = value
+
+def _remove(document, pointer):
+    parent, key = _parent(document, pointer)
+    return parent.pop(_index(parent, key))
+
+def apply_patch(document, operations):
+    """Применяет список операций к копии документа и возвращает её; исходный документ не меняется"""
+    if not isinstance(operations, list):
+        raise ValueError("Патч должен быть списком операций")
+    document = copy.deepcopy(document)
+    for operation in operations:
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise ValueError(f"Неверная операция патча: {operation!r}")
+        op, path = operation['op'], operation['path']
+        if not isinstance(path, str):
+            raise ValueError(f"Путь операции должен быть строкой: {path!r}")
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise ValueError(f"Операции {op} нужно поле value")
+        if op in ('move', 'copy') and not isinstance(operation.get('from'), str):
+            raise ValueError(f"Операции {op} нужно строковое поле from")
+
+        if op == 'add':
+            _add(document, path, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(document, path)
+        elif op == 'replace':
+            parent, key = _parent(document, path)
+            parent[_index(parent, key)] = copy.deepcopy(operation['value'])
+        elif op == 'move':
+            if path.startswith(operation['from'] + '/'):
+                raise ValueError("Нельзя переместить значение внутрь самого себя")
+            _add(document, path, _remove(document, operation['from']))
+        elif op == 'copy':
+            _add(document, path, copy.deepcopy(resolve_pointer(document, operation['from'])))
+        elif op == 'test':
+            if resolve_pointer(document, path) != operation['value']:
+                raise ValueError(f"Проверка {path} не прошла: значение изменилось")
+        else:
+            raise ValueError(f"Неизвестная операция патча: {op!r}")
+    return document
@@ -0,0 +1,128 @@
+"""Предзагрузка лекций после генерации плана курса
+
+После сохранения плана пользователь почти всегда по порядку открывает первые
+темы и генерирует по ним лекции. Если PREFETCH_LECTURES > 0, сервер сразу
+генерирует в фоне лекции по первым PREFETCH_LECTURES темам и сохраняет их через
+save_lecture, так что /generate_lecture и /get_lecture отвечают без ожидания.
+
+Состояние предзагрузки хранится в таблице prefetched_lectures — по ней считаются
+доля попаданий и потраченные впустую токены (/api/prefetch_stats).
+"""
+import asyncio
+import logging
+import threading
+
+import services
+import singleflight
+from config.config import PREFETCH_LECTURES, PREFETCH_CONCURRENCY, PREFETCH_TOKEN_BUDGET
+from generate_ai import TOKEN_USAGE
+
+# Идущие в этом процессе предзагрузки: id программы -> (ключ плана, Task)
+_running = {}
+_running_lock = threading.Lock()
+
+def enabled():
+    return PREFETCH_LECTURES > 0
+
+def schedule(db, program, course_plan):
+    """Запускает предзагрузку лекций по первым темам плана, отменяя предыдущую для программы
+
+    Вызывается из обработчика запроса: задача создаётся в его event loop.
+    """
+    if not enabled():
+        return
+    themes = [
+        theme for theme, content in course_plan.items()
+        if theme.lower() != 'literature' and isinstance(content, dict)
+    ][:PREFETCH_LECTURES]
+    if not themes:
+        return
+
+    plan_key = singleflight.make_key('prefetch', program['id'], None, course_plan)
+    with _running_lock:
+        previous = _running.pop(program['id'], None)
+        if previous is not None:
+            previous_key, previous_handle = previous
+            if previous_key == plan_key:
+                # Этот же план уже предзагружается (например, запросы плана схлопнулись)
+                _running[program['id']] = previous
+                return
+            previous_handle.cancel()
+        handle = asyncio.get_running_loop().create_task(_prefetch(db, program, course_plan, themes))
+        _running[program['id']] = (plan_key, handle)
+    handle.add_done_callback(lambda _: _forget(program['id'], handle))
+
+def cancel_running(program_id):
+    """Отменяет идущую в этом процессе предзагрузку программы, не обращаясь к базе
+
+    Для остальных процессов предзагрузку отменяет db.cancel_prefetch.
+    """
+    with _running_lock:
+        running = _running.pop(program_id, None)
+    if running is not None:
+        running[1].cancel()
+
+def claim(db, program_id, theme):
+    """Забирает предзагруженную лекцию, если она уже готова
+
+    Returns:
+        dict: Лекция из базы данных или None, если её нужно генерировать (если
+        предзагрузка темы ещё идёт, генерация схлопнется с ней через single-flight)
+    """
+    if db.claim_prefetch(program_id, theme) == 'ready':
+        logging.info(f'Предзагрузка: попадание для программы {program_id}, тема {theme}')
+        return db.get_lecture(program_id, theme)
+    return None
+
+async def _prefetch(db, program, course_plan, themes):
+    # Записи предзагрузки адресуются по id внутри базы программы (её шарда). Шард
+    # берётся заново на каждое обращение: предзагрузка идёт минутами, и удерживаемый
+    # ею шард после вытеснения из LRU-кэша открылся бы снова мимо кэша
+    def in_shard(method, *args):
+        return asyncio.to_thread(lambda: getattr(db.for_program(program['id']), method)(*args))
+
+    ids = await in_shard('start_prefetch', program['id'], themes)
+    semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+    spent = [0]
+
+    async def prefetch_theme(theme):
+        async with semaphore:
+            # Бюджет проверяется перед стартом темы, поэтому может быть превышен
+            # не более чем на PREFETCH_CONCURRENCY - 1 лекций
+            if PREFETCH_TOKEN_BUDGET and spent[0] >= PREFETCH_TOKEN_BUDGET:
+                await in_shard('update_prefetch', ids[theme], 'pending', 'skipped')
+                return
+            # Пользователь мог уже запросить тему или предзагрузку отменили
+            if not await in_shard('update_prefetch', ids[theme], 'pending', 'running'):
+                return
+
+            usage = []
+            TOKEN_USAGE.set(usage)
+            try:
+                await services.generate_lecture(db, program, course_plan, theme)
+            except asyncio.CancelledError:
+                await in_shard('update_prefetch', ids[theme], 'running', 'cancelled')
+                raise
+            except Exception:
+                logging.exception(f'Предзагрузка лекции "{theme}" не удалась:')
+                await in_shard('update_prefetch', ids[theme], 'running', 'failed')
+                return
+            finally:
+                spent[0] += sum(usage)
+                await in_shard('add_prefetch_tokens', ids[theme], sum(usage))
+            await in_shard('update_prefetch', ids[theme], 'running', 'ready')
+
+    logging.info(f'Предзагрузка лекций для программы {program["id"]}: {themes}')
+    try:
+        await asyncio.gather(*(prefetch_theme(theme) for theme in themes))
+    except asyncio.CancelledError:
+        # Отменяем только свои записи: новая предзагрузка программы могла уже начаться
+        for prefetch_id in ids.values():
+            await in_shard('update_prefetch', prefetch_id, 'pending', 'cancelled')
+        raise
+
+def _forget(program_id, handle):
+    with _running_lock:
+        running = _running.get(program_id)
+        if running is not None and running[1] is handle:
+            del _running[program_id]
@@ -0,0 +1,22 @@
+"""Production-запуск приложения под ASGI-сервером Hypercorn
+
+    python serve.py
+
+Количество воркеров, адрес и порт задаются в .env (SERVER_WORKERS, SERVER_HOST,
+SERVER_PORT). Для разработки по-прежнему можно запускать `python app.py`.
+"""
+from hypercorn.config import Config
+from hypercorn.run import run
+
+from config.config import SERVER_HOST, SERVER_PORT, SERVER_WORKERS
+
+def main():
+    config = Config()
+    config.application_path = "asgi:app"
+    config.bind = [f"{SERVER_HOST}:{SERVER_PORT}"]
+    config.workers = SERVER_WORKERS
+    config.accesslog = "-"
+    run(config)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,478 @@
+import asyncio
+import io
+import json
+import logging
+import re
+import uuid
+
+from generate_ai import ai_generate
+import json_patch
+import singleflight
+
+# Поля, из которых состоит лекция (пара)
+LECTURE_FIELDS = ['introduction', 'sections', 'conclusion', 'recommendations']
+
+def clean_ai_response(response, response_type="lecture"):
+    """Очищает ответ ИИ от markdown-обёртки и форматирования и пытается привести к валидному JSON
+    
+    Args:
+        response (str): Ответ от ИИ
+        response_type (str): Тип ответа ("lecture", "programs"; для остальных JSON возвращается как есть)
+    """
+    try:
+        clean = response.strip()
+        
+        # Проверяем, является ли ответ markdown-документом
+        if clean.startswith('#') or '###' in clean:
+            raise ValueError("Получен markdown-документ вместо JSON. Пожалуйста, проверьте формат ответа от ИИ.")
+            
+        # 1. Вырезаем только JSON-блок, если он есть
+        match = re.search(r'```json\s*([\s\S]+?)\s*```', clean)
+        if not match:
+            match = re.search(r'```\s*([\s\S]+?)\s*```', clean)
+        if match:
+            clean = match.group(1).strip()
+        else:
+            # Если нет markdown-блока, ищем первую и последнюю фигурную скобку
+            first = clean.find('{')
+            last = clean.rfind('}')
+            if first != -1 and last != -1 and last > first:
+                clean = clean[first:last+1]
+            else:
+                raise ValueError("Не найден JSON-блок в ответе ИИ")
+                
+        # Логируем очищенный ответ для отладки
+        logging.debug(f"Очищенный ответ: {clean}")
+        
+        # Попытка привести к валидному JSON
+        # 1. Если ключи или строки в одинарных кавычках — заменить на двойные (если нет вложенных двойных)
+        if "'" in clean and '"' not in clean:
+            clean = clean.replace("'", '"')
+        # 2. Если ключи без кавычек (YAML-стиль), добавить кавычки (простая эвристика)
+        clean = re.sub(r'([,{]\s*)([a-zA-Z0-9_]+)(\s*:)','\\1"\\2"\\3', clean)
+        # 3. Удалить лишние переносы строк внутри JSON
+        clean = re.sub(r'\n+', ' ', clean)
+        # 4. Удалить markdown-обёртки, если остались
+        clean = clean.replace('```', '').strip()
+        
+        # Проверяем на незавершенные строки и исправляем их
+        lines = clean.split('\n')
+        fixed_lines = []
+        for line in lines:
+            if line.count('"') % 2 != 0:
+                line = line + '"'
+            fixed_lines.append(line)
+        clean = '\n'.join(fixed_lines)
+        
+        # Проверяем и исправляем структуру JSON
+        try:
+            if not clean.startswith('{'):
+                clean = '{' + clean
+            if not clean.endswith('}'):
+                clean = clean + '}'
+            clean = re.sub(r'"\s*}\s*"', '", "', clean)
+            clean = re.sub(r'"\s*}\s*{', '", "', clean)
+            clean = re.sub(r',\s*,', ',', clean)
+            clean = re.sub(r',\s*}', '}', clean)
+            clean = re.sub(r',\s*]', ']', clean)
+            
+            # Пытаемся распарсить JSON
+            result = json.loads(clean)
+            
+            # В зависимости от типа ответа применяем разные правила валидации
+            if response_type == "lecture":
+                # Проверяем наличие всех обязательных полей для лекции
+                required_fields = ['introduction', 'sections', 'conclusion', 'recommendations']
+                missing_fields = [field for field in required_fields if field not in result]
+                
+                if missing_fields:
+                    # Если отсутствуют поля, добавляем их с пустыми значениями
+                    for field in missing_fields:
+                        if field == 'sections':
+                            result[field] = []
+                        elif field == 'recommendations':
+                            result[field] = []
+                        else:
+                            result[field] = ""
+            elif response_type == "programs":
+                # Удаляем поля, специфичные для лекций
+                lecture_fields = ['introduction', 'sections', 'conclusion', 'recommendations']
+                for field in lecture_fields:
+                    if field in result:
+                        del result[field]
+            
+            return result
+            
+        except json.JSONDecodeError as e:
+            logging.error(f"Ошибка при разборе JSON: {str(e)}")
+            logging.error(f"Позиция ошибки: строка {e.lineno}, колонка {e.colno}")
+            logging.error(f"Очищенный ответ: {clean}")
+            raise ValueError(f"Не удалось разобрать JSON-ответ от ИИ: {str(e)}")
+            
+    except Exception as e:
+        logging.error(f"Ошибка при очистке ответа: {str(e)}")
+        logging.error(f"Исходный ответ: {response}")
+        raise ValueError(f"Не удалось обработать ответ от ИИ: {str(e)}")
+
+
+async def safe_ai_generate(prompt, mode, max_retries=3):
+    """Вызывает ИИ с повторными попытками при пустом ответе или ошибке"""
+    last_error = None
+    for attempt in range(max_retries):
+        try:
+            result = await ai_generate(prompt, mode)
+            if result is not None and result.strip():
+                return result
+            print(f"⚠️ Пустой ответ от ИИ (попытка {attempt + 1}/{max_retries}), пробуем снова...")
+        except Exception as e:
+            last_error = e
+            print(f"⚠️ Ошибка при генерации (попытка {attempt + 1}/{max_retries}): {str(e)}")
+            if hasattr(e, 'response'):
+                print(f"Ответ API: {e.response.text}")
+                # Проверяем на превышение лимита
+                if 'Rate limit exceeded' in str(e.response.text):
+                    raise ValueError("Превышен дневной лимит запросов к ИИ. Пожалуйста, попробуйте завтра или добавьте кредиты в настройках API.")
+    if last_error:
+        raise ValueError(f"❌ Не удалось получить корректный ответ от ИИ после {max_retries} попыток. Последняя ошибка: {str(last_error)}")
+    raise ValueError(f"❌ Не удалось получить корректный ответ от ИИ после {max_retries} попыток.")
+
+def get_theme_number(theme):
+    """Извлекает номер темы ("Тема 3: ...") для сортировки; литература и темы без номера идут в конец"""
+    try:
+        # Ищем число после слова "Тема" или "Тема:"
+        match = re.search(r'Тема\s*:?\s*(\d+)', theme)
+        if match:
+            return int(match.group(1))
+        # Если не нашли номер (или это литература), помещаем в конец
+        return float('inf')
+    except Exception:
+        return float('inf')
+
+def sort_course_plan(plan_dict):
+    """Сортирует темы плана по номеру, литературу ставит в конец"""
+    # Удаляем поля, специфичные для лекций, если они вдруг попали в план
+    for field in LECTURE_FIELDS:
+        if field in plan_dict:
+            del plan_dict[field]
+
+    sorted_plan = {}
+    for theme in sorted(plan_dict.keys(), key=get_theme_number):
+        if theme.lower() != 'literature':
+            sorted_plan[theme] = plan_dict[theme]
+
+    # В конце добавляем литературу, если она есть
+    if 'literature' in plan_dict:
+        sorted_plan['literature'] = plan_dict['literature']
+    return sorted_plan
+
+def new_theme_id():
+    return uuid.uuid4().hex
+
+def assign_theme_ids(plan):
+    """Присваивает стабильный theme_id темам плана, у которых его ещё нет
+
+    По theme_id к теме привязываются лекции (lectures.theme_id), поэтому он не
+    меняется при переименовании темы и при перегенерации соседних тем.
+    """
+    for theme, content in plan.items():
+        if theme.lower() != 'literature' and isinstance(content, dict) and not content.get('theme_id'):
+            content['theme_id'] = new_theme_id()
+    return plan
+
+def strip_theme_ids(value):
+    """Копия плана или темы без theme_id — служебные id не нужны ИИ и только тратят токены"""
+    if isinstance(value, dict):
+        return {key: strip_theme_ids(item) for key, item in value.items() if key != 'theme_id'}
+    return value
+
+def build_lecture_prompt(program, theme, course_plan, theme_content):
+    """Формирует промпт для генерации лекции с явным указанием формата ответа"""
+    return f"""Сгенерируй лекцию по теме "{theme}" для курса "{program['title']}".
+        Ответ должен быть в формате JSON со следующей структурой:
+        {{
+            "introduction": "Введение в тему",
+            "sections": [
+                {{
+                    "title": "Название раздела",
+                    "content": "Содержание раздела"
+                }}
+            ],
+            "conclusion": "Заключение",
+            "recommendations": ["Рекомендация 1", "Рекомендация 2"]
+        }}
+        
+        Используй следующие данные для генерации:
+        План курса: {strip_theme_ids(course_plan)}
+        Содержание темы: {strip_theme_ids(theme_content)}
+        """
+
+def normalize_lecture(lecture_dict):
+    """Приводит ответ ИИ к структуре лекции, оставляя только нужные поля"""
+    # Если AI вернул словарь с одним ключом типа pair_1, pair_2 и т.д. — берём его содержимое
+    if (
+        isinstance(lecture_dict, dict)
+        and len(lecture_dict) == 1
+        and list(lecture_dict.keys())[0].startswith('pair_')
+    ):
+        lecture_dict = list(lecture_dict.values())[0]
+    if not isinstance(lecture_dict, dict):
+        raise ValueError("Неверный формат ответа от ИИ")
+    return {field: lecture_dict.get(field, [] if field in ('sections', 'recommendations') else '')
+            for field in LECTURE_FIELDS}
+
+async def generate_program_names(course_theme, keywords):
+    """Генерирует названия и краткие описания программ по теме курса и ключевым словам
+
+    Returns:
+        dict: Название программы -> описание
+    """
+    programs = await safe_ai_generate([course_theme, keywords], "names_programs")
+    if not programs:
+        raise ValueError("Получен пустой ответ от ИИ")
+    return clean_ai_response(programs, response_type="programs")
+
+async def generate_course_plan(db, program, on_saved=None):
+    """Генерирует план курса для программы и сохраняет его в базу данных
+
+    Одновременные запросы плана для одной программы схлопываются в одну генерацию.
+    on_saved(plan) вызывается после сохранения только у лидера генерации — в том
+    числе когда остальные запросы ждут его в других воркерах (см. prefetch.schedule).
+    """
+    # Передаем и заголовок, и описание программы
+    result = [program['title'], program['description']]
+
+    async def generate():
+        plan = await safe_ai_generate(result, "generate_full_program")
+        plan_dict = clean_ai_response(plan)
+        logging.info(f'План курса для программы {program["id"]}: {plan_dict}')
+
+        sorted_plan = assign_theme_ids(sort_course_plan(plan_dict))
+        # Работа с SQLite блокирующая — выносим её в пул потоков
+        await asyncio.to_thread(db.save_course_plan, program['id'], sorted_plan)
+        if on_saved is not None:
+            on_saved(sorted_plan)
+        return sorted_plan
+
+    key = singleflight.make_key('generate_course_plan', program['id'], None, result)
+    return await singleflight.run(db, key, generate)
+
+async def generate_lecture(db, program, course_plan, theme, save=True):
+    """Генерирует лекцию по теме плана и сохраняет её в базу данных
+
+    При save=False лекция не сохраняется — её сохраняет вызывающий (пакетная
+    генерация пишет лекции в базу пачками, см. batch.py).
+
+    Returns:
+        dict: Лекция, обёрнутая в ключ темы ({theme: {...}})
+    """
+    theme_content = course_plan[theme]
+    # Формируем результат в правильном формате для AI
+    result = [
+        program['title'],  # Название курса
+        theme,            # Тема лекции
+        course_plan,      # Структурированный план ВСЕЙ лекции
+        theme_content     # Структурированный план необходимой лекции (пары)
+    ]
+    logging.info(f'Генерация лекции для темы {theme} с данными: {result}')
+
+    prompt = build_lecture_prompt(program, theme, course_plan, theme_content)
+
+    async def generate():
+        lecture = await safe_ai_generate(prompt, "generate_theme_lection")
+        try:
+            lecture_dict = normalize_lecture(clean_ai_response(lecture))
+        except ValueError as e:
+            logging.error(f"Ошибка при обработке ответа AI: {str(e)}")
+            logging.error(f"Исходный ответ AI: {lecture}")
+            raise ValueError('AI вернул ответ в неверном формате. Попробуйте сгенерировать лекцию снова.')
+
+        # Оборачиваем результат в ключ темы
+        lecture_wrapped = {theme: lecture_dict}
+        if save:
+            await asyncio.to_thread(db.save_lecture, program['id'], theme, lecture_wrapped,
+                                    theme_content.get('theme_id'))
+        return lecture_wrapped
+
+    # Несохраняемая генерация не должна схлопываться с сохраняющей: иначе лекция не попадёт в базу
+    key = singleflight.make_key('generate_lecture' if save else 'generate_lecture_unsaved', program['id'], theme, prompt)
+    return await singleflight.run(db, key, generate)
+
+async def regenerate_themes(db, program, themes, literature=False):
+    """Перегенерирует только выбранные темы плана и/или блок литературы
+
+    ИИ получает не весь план, а его оглавление (названия и краткие описания тем)
+    и текущее содержимое выбранных тем. Новые темы встают на места старых с новыми
+    theme_id, остальные темы плана и привязанные к ним лекции не меняются.
+
+    Returns:
+        dict: Обновлённый план курса
+    """
+    if not themes and not literature:
+        raise ValueError('Не выбраны темы для перегенерации')
+    # Старому плану без theme_id присваиваем их и привязываем к ним уже созданные лекции
+    plan = await asyncio.to_thread(db.patch_course_plan, program['id'], assign_theme_ids)
+    if plan is None:
+        raise ValueError('План курса не найден')
+    await asyncio.to_thread(db.link_lectures, program['id'], {
+        theme: content['theme_id'] for theme, content in plan.items()
+        if isinstance(content, dict) and content.get('theme_id')
+    })
+    unknown = [theme for theme in themes if theme not in plan or theme.lower() == 'literature']
+    if unknown:
+        raise ValueError(f'Темы не найдены в плане курса: {", ".join(unknown)}')
+
+    outline = [
+        {'title': theme, 'short_description': content.get('short_description', ''), 'regenerate': theme in themes}
+        for theme, content in plan.items()
+        if theme.lower() != 'literature' and isinstance(content, dict)
+    ]
+    result = [
+        program['title'],
+        program['description'],
+        outline,                                                    # Оглавление курса
+        {theme: strip_theme_ids(plan[theme]) for theme in themes},  # Темы, которые нужно заменить
+        plan.get('literature', {}) if literature else None,         # Литература, если её нужно заменить
+    ]
+
+    async def generate():
+        response = await safe_ai_generate(result, "regenerate_themes")
+        response_dict = clean_ai_response(response, response_type="plan")
+        new_themes = response_dict.get('themes') or []
+        if len(new_themes) != len(themes) or not all(isinstance(item, dict) for item in new_themes):
+            raise ValueError(f'ИИ вернул {len(new_themes)} тем вместо {len(themes)}. Попробуйте снова.')
+        if literature and not isinstance(response_dict.get('literature'), dict):
+            raise ValueError('ИИ не вернул блок литературы. Попробуйте снова.')
+        replacements = dict(zip(themes, new_themes))
+
+        def merge(current):
+            missing = [theme for theme in themes if theme not in current]
+            if missing:
+                raise ValueError(f'Темы удалены из плана во время перегенерации: {", ".join(missing)}')
+            merged = {}
+            for theme, content in current.items():
+                if theme in replacements:
+                    new_content = {key: value for key, value in replacements[theme].items() if key != 'title'}
+                    title = replacements[theme].get('title') or theme
+                    # Новое название не должно совпасть с другой темой плана — иначе оставляем старое
+                    if title in merged or (title != theme and title in current):
+                        title = theme
+                    new_content['theme_id'] = new_theme_id()
+                    merged[title] = new_content
+                elif theme == 'literature' and literature:
+                    merged[theme] = response_dict['literature']
+                else:
+                    merged[theme] = content
+            if literature and 'literature' not in merged:
+                merged['literature'] = response_dict['literature']
+            return merged
+
+        # Слияние — в транзакции: правки других тем, сделанные во время генерации, сохраняются
+        merged_plan = await asyncio.to_thread(db.patch_course_plan, program['id'], merge)
+        logging.info(f'Перегенерированы темы {themes} (литература: {literature}) для программы {program["id"]}')
+        return merged_plan
+
+    key = singleflight.make_key('regenerate_themes', program['id'], None, result)
+    return await singleflight.run(db, key, generate)
+
+async def generate_big_lecture(db, program, theme):
+    """Генерирует большую лекцию по теме и сохраняет её в базу данных"""
+    prompt = f"{theme} (курс: {program['title']})"
+
+    async def generate():
+        logging.info(f'Генерация большой лекции по теме: {prompt}')
+        lecture = await safe_ai_generate(prompt, "generate_big_lecture")
+        lecture_dict = clean_ai_response(lecture)
+        await asyncio.to_thread(db.save_lecture, program['id'], theme, lecture_dict)
+        return lecture_dict
+
+    key = singleflight.make_key('generate_big_lecture', program['id'], theme, prompt)
+    return await singleflight.run(db, key, generate)
+
+def lecture_content(lecture, theme):
+    """Содержимое лекции: обычные лекции хранятся обёрнутыми в ключ темы, большие — без обёртки"""
+    return lecture.get(theme, lecture)
+
+def get_theme(db, program_id, theme, pointer=''):
+    """Тема плана (или её часть по JSON Pointer); None, если плана или темы нет"""
+    plan = db.get_course_plan(program_id)
+    if not plan or theme not in plan:
+        return None
+    return json_patch.resolve_pointer(plan[theme], pointer)
+
+def get_lecture_part(db, program_id, theme, pointer=''):
+    """Содержимое лекции (или его часть по JSON Pointer); None, если лекции нет"""
+    lecture = db.get_lecture(program_id, theme)
+    if not lecture:
+        return None
+    return json_patch.resolve_pointer(lecture_content(lecture, theme), pointer)
+
+def patch_course_plan(db, program_id, operations):
+    """Применяет JSON Patch ко всему плану; возвращает новый план или None, если плана нет"""
+    return db.patch_course_plan(program_id, lambda plan: json_patch.apply_patch(plan, operations))
+
+def patch_theme(db, program_id, theme, operations):
+    """Применяет JSON Patch к одной теме плана (пути — относительно темы); возвращает обновлённую тему"""
+    def apply(plan):
+        if theme not in plan:
+            raise KeyError(theme)
+        plan[theme] = json_patch.apply_patch(plan[theme], operations)
+        return plan
+
+    try:
+        plan = db.patch_course_plan(program_id, apply)
+    except KeyError:
+        return None
+    return plan[theme] if plan else None
+
+def patch_lecture(db, program_id, theme, operations):
+    """Применяет JSON Patch к содержимому лекции по теме; возвращает обновлённое содержимое"""
+    def apply(lecture):
+        if theme in lecture:
+            lecture[theme] = json_patch.apply_patch(lecture[theme], operations)
+            return lecture
+        return json_patch.apply_patch(lecture, operations)
+
+    lecture = db.patch_lecture(program_id, theme, apply)
+    return lecture_content(lecture, theme) if lecture else None
+
+def build_lecture_docx(theme, lecture):
+    """Собирает документ Word по лекции и возвращает его в виде BytesIO"""
+    # python-docx загружается только при первой выгрузке, а не при старте приложения
+    from docx import Document
+
+    # Если lecture[theme] содержит только нужные поля, используем их напрямую
+    content = lecture_content(lecture, theme)
+
+    doc = Document()
+    doc.add_heading(theme, 0)
+
+    # Введение
+    doc.add_heading('Введение', level=2)
+    doc.add_paragraph(content.get('introduction', ''))
+
+    # Основные разделы
+    doc.add_heading('Основные разделы', level=2)
+    sections = content.get('sections', [])
+    if sections:
+        for section in sections:
+            doc.add_paragraph(section.get('title', ''), style='Heading 3')
+            doc.add_paragraph(section.get('content', ''))
+    else:
+        doc.add_paragraph('Нет разделов для отображения', style='Intense Quote')
+
+    # Заключение
+    doc.add_heading('Заключение', level=2)
+    doc.add_paragraph(content.get('conclusion', ''))
+
+    # Рекомендации
+    recommendations = content.get('recommendations', [])
+    if recommendations:
+        doc.add_heading('Рекомендации', level=2)
+        for rec in recommendations:
+            doc.add_paragraph(rec, style='List Bullet')
+
+    # Сохраняем документ в память
+    doc_io = io.BytesIO()
+    doc.save(doc_io)
+    doc_io.seek(0)
+    return doc_io
@@ -0,0 +1,113 @@
+"""Single-flight: схлопывание одинаковых одновременных генераций
+
+Если несколько запросов одновременно просят одну и ту же генерацию (двойной клик,
+два пользователя на одной программе), к ИИ уходит только один вызов, а остальные
+ждут его результат. Внутри процесса ожидающие подписываются на общий Future,
+между процессами (воркерами) лидер определяется арендой в таблице
+generation_leases, а остальные опрашивают её до появления результата.
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from config.config import SINGLEFLIGHT_LEASE_TTL, SINGLEFLIGHT_POLL_INTERVAL
+
+# Сколько секунд готовый результат остаётся в таблице аренд для процессов-последователей
+RESULT_TTL = max(5.0, SINGLEFLIGHT_POLL_INTERVAL * 10)
+
+# Генерации, идущие в этом процессе: ключ -> Future с результатом.
+# concurrent.futures, а не asyncio, — чтобы работало и между потоками и event loop-ами.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+class LeaderCancelled(Exception):
+    """Генерация-лидер была отменена — ожидающие должны попробовать сами"""
+
+def make_key(route, program_id, theme, prompt):
+    """Ключ генерации: (маршрут, программа, тема, хэш промпта)"""
+    payload = json.dumps(prompt, ensure_ascii=False, sort_keys=True, default=str)
+    prompt_hash = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+    return f"{route}:{program_id}:{theme or ''}:{prompt_hash}"
+
+async def run(db, key, func):
+    """Выполняет func() один раз на все одновременные вызовы с одинаковым ключом
+
+    Args:
+        db: Database, в которой хранятся аренды между процессами
+        key (str): Ключ генерации (см. make_key)
+        func: async-функция без аргументов; её результат должен сериализоваться в JSON
+
+    Returns:
+        Результат func() — свой или полученный от лидера
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = concurrent.futures.Future()
+            _inflight[key] = future
+
+    if not is_leader:
+        logging.info(f'Single-flight: ожидаем уже идущую генерацию {key}')
+        try:
+            # shield: отмена одного ожидающего не должна отменять общий Future
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except LeaderCancelled:
+            return await run(db, key, func)
+
+    try:
+        result = await _run_across_processes(db, key, func)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.set_exception(LeaderCancelled(key))
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+async def _run_across_processes(db, key, func):
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+    while True:
+        if await asyncio.to_thread(db.acquire_lease, key, owner, SINGLEFLIGHT_LEASE_TTL):
+            return await _lead(db, key, owner, func)
+
+        logging.info(f'Single-flight: генерация {key} идёт в другом процессе, ждём результат')
+        while True:
+            await asyncio.sleep(SINGLEFLIGHT_POLL_INTERVAL)
+            lease = await asyncio.to_thread(db.get_lease, key)
+            if lease is None:
+                # Лидер завершился с ошибкой или аренда истекла — пробуем стать лидером сами
+                break
+            if lease['status'] == 'done':
+                return lease['result']
+            if lease['expires_at'] < time.time():
+                # Лидер перестал продлевать аренду (процесс упал) — перехватываем её
+                break
+
+async def _lead(db, key, owner, func):
+    keep_alive = asyncio.create_task(_keep_lease_alive(db, key, owner))
+    try:
+        result = await func()
+    except BaseException:
+        keep_alive.cancel()
+        await asyncio.to_thread(db.release_lease, key, owner)
+        raise
+    keep_alive.cancel()
+    await asyncio.to_thread(db.complete_lease, key, owner, result, RESULT_TTL)
+    return result
+
+async def _keep_lease_alive(db, key, owner):
+    while True:
+        await asyncio.sleep(SINGLEFLIGHT_LEASE_TTL / 3)
+        await asyncio.to_thread(db.renew_lease, key, owner, SINGLEFLIGHT_LEASE_TTL)
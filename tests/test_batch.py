@@ -0,0 +1,123 @@
+import argparse
+import asyncio
+import json
+
+import pytest
+
+import batch
+import generate_ai
+from database.checkpoint import Checkpoint
+from database.db import Database
+
+PLAN = {f"Тема {i}: Модуль {i}": {"short_description": "Описание", "hours": 6} for i in range(1, 4)}
+LECTURE = {"introduction": "Введение", "sections": [], "conclusion": "Заключение", "recommendations": []}
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / "test.db"))
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    return Checkpoint(str(tmp_path / "checkpoint.db"))
+
+@pytest.fixture
+def fake_ai(monkeypatch):
+    """Подменяет ИИ; названия программ для тем из fake_ai.failing не генерируются"""
+    class FakeAI:
+        calls = []
+        failing = set()
+
+    async def fake_ai_generate(text, mode):
+        FakeAI.calls.append(mode)
+        if mode == "names_programs" and text[0] in FakeAI.failing:
+            return None
+        if mode == "names_programs":
+            return json.dumps({f"{text[0]}: программа {i}": "Описание" for i in range(1, 4)}, ensure_ascii=False)
+        if mode == "generate_full_program":
+            return json.dumps(PLAN, ensure_ascii=False)
+        return json.dumps(LECTURE, ensure_ascii=False)
+
+    monkeypatch.setattr(generate_ai, "_ai_generate", fake_ai_generate)
+    return FakeAI
+
+def make_args(**overrides):
+    args = dict(programs=2, lectures=0, no_lectures=False, concurrency=4, rate=0,
+                lecture_batch=4, progress_interval=60)
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+ROWS = [
+    {"course_theme": "Физика", "keywords": ["механика"], "department": None},
+    {"course_theme": "Химия", "keywords": ["органика"], "department": None},
+]
+
+def test_read_rows(tmp_path):
+    with_header = tmp_path / "courses.csv"
+    with_header.write_text("course_theme,keywords,department\nФизика,\"механика; оптика\",Кафедра\n,пусто,\n",
+                           encoding="utf-8")
+    without_header = tmp_path / "plain.csv"
+    without_header.write_text("Химия,органика\n", encoding="utf-8")
+    jsonl = tmp_path / "courses.jsonl"
+    jsonl.write_text(json.dumps({"course_theme": "Биология", "keywords": ["клетка", " "]}) + "\n\n",
+                     encoding="utf-8")
+
+    assert batch.read_rows(str(with_header)) == [
+        {"course_theme": "Физика", "keywords": ["механика", "оптика"], "department": "Кафедра"}]
+    assert batch.read_rows(str(without_header)) == [
+        {"course_theme": "Химия", "keywords": ["органика"], "department": None}]
+    assert batch.read_rows(str(jsonl)) == [
+        {"course_theme": "Биология", "keywords": ["клетка"], "department": None}]
+
+def test_row_key_ignores_position():
+    assert batch.row_key(ROWS[0]) == batch.row_key(dict(ROWS[0]))
+    assert batch.row_key(ROWS[0]) != batch.row_key(ROWS[1])
+
+def test_run_generates_everything_in_one_pass(db, checkpoint, fake_ai):
+    progress = asyncio.run(batch.run_batch(ROWS, db, checkpoint, make_args()))
+    # 2 строки: названия + 2 программы × (план + 3 лекции)
+    assert (progress.generated, progress.failed) == (2 + 2 * 2 * 4, 0)
+    assert len(db.get_all_programs()) == 6
+    program_id = db.get_all_programs()[0]["id"]
+    assert db.get_lecture_themes(program_id) == list(PLAN)
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*), COUNT(theme_id) FROM lectures").fetchone() == (12, 12)
+
+def test_rerun_resumes_only_failed_steps(db, checkpoint, fake_ai):
+    fake_ai.failing = {"Химия"}
+    first = asyncio.run(batch.run_batch(ROWS, db, checkpoint, make_args()))
+    assert (first.generated, first.failed) == (1 + 2 * 4, 1)
+    assert checkpoint.get_counts()["failed"] == 1
+    assert len(db.get_all_programs()) == 3
+
+    fake_ai.failing = set()
+    calls_before = len(fake_ai.calls)
+
+    second = asyncio.run(batch.run_batch(ROWS, db, checkpoint, make_args()))
+    assert second.failed == 0
+    # Заново генерируется только "Химия": названия, планы и лекции
+    assert second.generated == 1 + 2 * 4
+    assert second.skipped == 1 + 2 * 4
+    assert "failed" not in checkpoint.get_counts()
+    assert len(fake_ai.calls) - calls_before == second.generated
+
+    third = asyncio.run(batch.run_batch(ROWS, db, checkpoint, make_args()))
+    assert third.generated == 0
+    assert len(db.get_all_programs()) == 6
+
+def test_rate_limiter_caps_concurrency():
+    active = []
+    peak = [0]
+
+    async def request(limiter):
+        async with limiter:
+            active.append(1)
+            peak[0] = max(peak[0], len(active))
+            await asyncio.sleep(0.01)
+            active.pop()
+
+    async def main():
+        limiter = batch.RateLimiter(2)
+        await asyncio.gather(*(request(limiter) for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak[0] == 2
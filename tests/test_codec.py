@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from database.codec import HEADER, MAGIC, ZLIB, ZSTD, Codec, train_dictionary, zstandard
+from database.db import Database
+from database.sharding import Shard
+
+LECTURE = {
+    "Тема 1": {
+        "introduction": "Введение в тему " * 40,
+        "sections": [{"title": f"Раздел {i}", "content": "Содержание раздела " * 20} for i in range(5)],
+        "conclusion": "Заключение",
+        "recommendations": ["Рекомендация"],
+    }
+}
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / "test.db"))
+
+def samples():
+    return [json.dumps({f"Тема {i}": {"introduction": "Введение в тему " * i, "sections": []}},
+                       ensure_ascii=False).encode("utf-8") for i in range(1, 200)]
+
+def test_small_value_is_plain_utf8_json():
+    encoded = Codec().encode({"тема": "кириллица"})
+    assert encoded == '{"тема": "кириллица"}'
+    assert Codec().decode(encoded) == {"тема": "кириллица"}
+
+def test_legacy_escaped_json_is_decoded():
+    assert Codec().decode('{"\\u0442\\u0435\\u043c\\u0430": 1}') == {"тема": 1}
+
+def test_round_trip_without_dictionary():
+    codec = Codec(algo=ZLIB)
+    encoded = codec.encode(LECTURE)
+    assert isinstance(encoded, bytes)
+    assert HEADER.unpack_from(encoded) == (MAGIC, ZLIB, 0)
+    assert len(encoded) < len(json.dumps(LECTURE, ensure_ascii=False).encode("utf-8"))
+    assert Codec().decode(encoded) == LECTURE
+
+@pytest.mark.parametrize("algo", [
+    ZLIB,
+    pytest.param(ZSTD, marks=pytest.mark.skipif(zstandard is None, reason="нет пакета zstandard")),
+])
+def test_round_trip_with_dictionary(algo):
+    dictionary = train_dictionary(samples(), size=4096, algo=algo)
+    codec = Codec({7: (algo, dictionary)}, current_dict_id=7)
+    encoded = codec.encode(LECTURE)
+    assert HEADER.unpack_from(encoded) == (MAGIC, algo, 7)
+    assert codec.decode(encoded) == LECTURE
+
+    # Словарь, которого нет в кодеке, догружается через loader
+    loaded = []
+    reader = Codec(loader=lambda dict_id: loaded.append(dict_id) or (algo, dictionary))
+    assert reader.decode(encoded) == LECTURE
+    assert loaded == [7]
+    with pytest.raises(KeyError):
+        Codec().decode(encoded)
+
+def test_database_uses_latest_dictionary(db):
+    program_id = db.save_program("Курс", "Описание")
+    db.save_lecture(program_id, "Тема 1", LECTURE)
+    dict_id = db.save_compression_dictionary(ZLIB, train_dictionary(samples(), size=4096, algo=ZLIB))
+    db.save_lecture(program_id, "Тема 1", LECTURE)
+
+    with db.get_connection() as conn:
+        old, new = [row[0] for row in conn.execute("SELECT content FROM lectures ORDER BY id")]
+    assert HEADER.unpack_from(old)[2] == 0
+    assert HEADER.unpack_from(new)[2] == dict_id
+    # Свежий экземпляр базы читает словари сам
+    assert Database(db.db_path).get_lecture(program_id, "Тема 1") == LECTURE
+
+def test_codec_load_keeps_callers_transaction(tmp_path):
+    # У шарда одно постоянное соединение: загрузка кодека через него внутри
+    # транзакции закоммитила бы её при выходе из вложенного with-блока
+    path = str(tmp_path / "shard.db")
+    Database(path).save_compression_dictionary(ZLIB, train_dictionary(samples(), size=4096, algo=ZLIB))
+    shard = Shard(path)
+    with shard.get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        assert shard.codec.current_dict_id == 1
+        assert conn.in_transaction
+
+def test_patch_on_shard_rolls_back_as_one_transaction(tmp_path):
+    path = str(tmp_path / "shard.db")
+    program_id = Shard(path).save_program("Курс", "Описание")
+    Shard(path).save_course_plan(program_id, LECTURE)
+
+    def fail(plan):
+        raise ValueError("патч не применился")
+
+    shard = Shard(path)
+    with pytest.raises(ValueError):
+        shard.patch_course_plan(program_id, fail)
+    with shard.get_connection() as conn:
+        assert not conn.in_transaction
+    assert shard.patch_course_plan(program_id, lambda plan: {"Тема 1": {}}) == {"Тема 1": {}}
+    assert Shard(path).get_course_plan(program_id) == {"Тема 1": {}}
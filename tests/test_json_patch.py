@@ -0,0 +1,111 @@
+import pytest
+
+from json_patch import apply_patch, parse_pointer, resolve_pointer
+
+THEME = {
+    "short_description": "Описание",
+    "key_issues": ["вопрос 1", "вопрос 2"],
+    "hours": 6,
+}
+
+def test_add_to_object_and_list():
+    result = apply_patch(THEME, [
+        {"op": "add", "path": "/control_point", "value": "тест"},
+        {"op": "add", "path": "/key_issues/1", "value": "вставка"},
+    ])
+    assert result["control_point"] == "тест"
+    assert result["key_issues"] == ["вопрос 1", "вставка", "вопрос 2"]
+
+def test_add_to_list_end():
+    result = apply_patch(THEME, [{"op": "add", "path": "/key_issues/-", "value": "последний"}])
+    assert result["key_issues"][-1] == "последний"
+
+def test_add_past_list_end_fails():
+    with pytest.raises(ValueError):
+        apply_patch(THEME, [{"op": "add", "path": "/key_issues/3", "value": "x"}])
+
+def test_remove():
+    result = apply_patch(THEME, [
+        {"op": "remove", "path": "/hours"},
+        {"op": "remove", "path": "/key_issues/0"},
+    ])
+    assert "hours" not in result
+    assert result["key_issues"] == ["вопрос 2"]
+
+def test_remove_missing_key_fails():
+    with pytest.raises(ValueError):
+        apply_patch(THEME, [{"op": "remove", "path": "/nope"}])
+
+def test_replace():
+    result = apply_patch(THEME, [{"op": "replace", "path": "/key_issues/1", "value": "новый"}])
+    assert result["key_issues"] == ["вопрос 1", "новый"]
+
+def test_replace_missing_key_fails():
+    with pytest.raises(ValueError):
+        apply_patch(THEME, [{"op": "replace", "path": "/nope", "value": 1}])
+
+def test_move():
+    result = apply_patch(THEME, [{"op": "move", "from": "/key_issues/0", "path": "/key_issues/-"}])
+    assert result["key_issues"] == ["вопрос 2", "вопрос 1"]
+    result = apply_patch(THEME, [{"op": "move", "from": "/hours", "path": "/duration"}])
+    assert result["duration"] == 6 and "hours" not in result
+
+def test_move_into_itself_fails():
+    document = {"a": {"b": 1}}
+    with pytest.raises(ValueError):
+        apply_patch(document, [{"op": "move", "from": "/a", "path": "/a/c"}])
+
+def test_copy_is_independent():
+    result = apply_patch(THEME, [
+        {"op": "copy", "from": "/key_issues", "path": "/questions"},
+        {"op": "add", "path": "/questions/-", "value": "только в копии"},
+    ])
+    assert result["key_issues"] == THEME["key_issues"]
+    assert result["questions"] == THEME["key_issues"] + ["только в копии"]
+
+def test_test_op():
+    assert apply_patch(THEME, [{"op": "test", "path": "/hours", "value": 6}]) == THEME
+    with pytest.raises(ValueError):
+        apply_patch(THEME, [{"op": "test", "path": "/hours", "value": 7}])
+
+def test_failed_operation_leaves_document_unchanged():
+    document = {"hours": 6, "items": [1]}
+    with pytest.raises(ValueError):
+        apply_patch(document, [
+            {"op": "replace", "path": "/hours", "value": 8},
+            {"op": "test", "path": "/items/0", "value": 2},
+        ])
+    assert document == {"hours": 6, "items": [1]}
+
+@pytest.mark.parametrize("index", ["01", "-1", "1.0", "x"])
+def test_invalid_list_index(index):
+    with pytest.raises(ValueError):
+        apply_patch(THEME, [{"op": "replace", "path": f"/key_issues/{index}", "value": "x"}])
+
+def test_dash_is_only_valid_for_add():
+    with pytest.raises(ValueError):
+        apply_patch(THEME, [{"op": "replace", "path": "/key_issues/-", "value": "x"}])
+
+def test_pointer_escapes():
+    assert parse_pointer("") == []
+    assert parse_pointer("/a~1b/c~0d/~01") == ["a/b", "c~d", "~1"]
+    document = {"Тема 1: a/b": {"x~y": 1}}
+    assert resolve_pointer(document, "/Тема 1: a~1b/x~0y") == 1
+    result = apply_patch(document, [{"op": "replace", "path": "/Тема 1: a~1b/x~0y", "value": 2}])
+    assert result == {"Тема 1: a/b": {"x~y": 2}}
+
+@pytest.mark.parametrize("operations", [
+    {"op": "add"},
+    [{"op": "add", "path": "/a"}],
+    [{"op": "move", "path": "/a"}],
+    [{"op": "frobnicate", "path": "/a"}],
+    [{"op": "add", "path": "a", "value": 1}],
+    [{"op": "remove", "path": ""}],
+    [{"op": "remove", "path": 1}],
+    [{"op": "add", "path": ["a"], "value": 1}],
+    [{"op": "move", "from": 1, "path": "/a"}],
+    [{"op": "copy", "from": None, "path": "/b"}],
+])
+def test_malformed_patches(operations):
+    with pytest.raises(ValueError):
+        apply_patch({"a": 1}, operations)
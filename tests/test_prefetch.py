@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+import pytest
+
+import generate_ai
+import prefetch
+import services
+from database.db import Database
+
+PLAN = {
+    f"Тема {i}: Модуль {i}": {"short_description": "Описание", "key_issues": ["вопрос"], "hours": 6}
+    for i in range(1, 4)
+}
+LECTURE = {"introduction": "Введение", "sections": [], "conclusion": "Заключение", "recommendations": []}
+TOKENS_PER_LECTURE = 50
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / "test.db"))
+
+@pytest.fixture
+def program(db):
+    program_id = db.save_program("Курс", "Описание")
+    db.save_course_plan(program_id, PLAN)
+    return {"id": program_id, "title": "Курс", "description": "Описание"}
+
+@pytest.fixture
+def fake_ai(monkeypatch):
+    """Подменяет ИИ: лекция после короткой задержки, расход токенов — через TOKEN_USAGE"""
+    calls = []
+
+    async def fake_ai_generate(text, mode):
+        calls.append(mode)
+        await asyncio.sleep(0.01)
+        usage = generate_ai.TOKEN_USAGE.get()
+        if usage is not None:
+            usage.append(TOKENS_PER_LECTURE)
+        if mode == "generate_full_program":
+            return json.dumps(PLAN, ensure_ascii=False)
+        return json.dumps(LECTURE, ensure_ascii=False)
+
+    monkeypatch.setattr(generate_ai, "_ai_generate", fake_ai_generate)
+    monkeypatch.setattr(prefetch, "PREFETCH_LECTURES", 2)
+    return calls
+
+def run_prefetch(db, program):
+    async def main():
+        prefetch.schedule(db, program, PLAN)
+        await prefetch._running[program["id"]][1]
+    asyncio.run(main())
+
+# --- Статусы в базе ---
+
+def test_claim_marks_hits_and_skips(db, program):
+    ids = db.start_prefetch(program["id"], ["А", "Б", "В"])
+    db.update_prefetch(ids["А"], "pending", "running")
+    db.update_prefetch(ids["А"], "running", "ready")
+    db.add_prefetch_tokens(ids["А"], 100)
+
+    assert db.claim_prefetch(program["id"], "А") == "ready"
+    assert db.claim_prefetch(program["id"], "А") is None
+    assert db.claim_prefetch(program["id"], "В") == "pending"
+    stats = db.get_prefetch_stats()
+    assert stats["by_status"] == {"used": 1, "pending": 1, "skipped": 1}
+    assert (stats["hits"], stats["hit_rate"], stats["tokens_spent"], stats["wasted_tokens"]) == (1, 1.0, 100, 0)
+
+def test_new_plan_discards_previous_prefetch(db, program):
+    ids = db.start_prefetch(program["id"], ["А", "Б"])
+    db.update_prefetch(ids["А"], "pending", "running")
+    db.update_prefetch(ids["А"], "running", "ready")
+    db.add_prefetch_tokens(ids["А"], 100)
+
+    db.start_prefetch(program["id"], ["А"])
+    stats = db.get_prefetch_stats()
+    assert stats["by_status"] == {"discarded": 1, "cancelled": 1, "pending": 1}
+    assert stats["wasted_tokens"] == 100
+
+def test_explicit_regeneration_discards_prefetch(db, program):
+    ids = db.start_prefetch(program["id"], ["А", "Б"])
+    db.update_prefetch(ids["А"], "pending", "running")
+    db.update_prefetch(ids["А"], "running", "ready")
+
+    db.discard_prefetch(program["id"], "А")
+    db.discard_prefetch(program["id"], "Б")
+    assert db.get_prefetch_stats()["by_status"] == {"discarded": 1, "skipped": 1}
+    assert db.claim_prefetch(program["id"], "А") is None
+
+# --- Фоновая предзагрузка ---
+
+def test_schedule_prefetches_first_themes(db, program, fake_ai):
+    run_prefetch(db, program)
+    first, second, third = PLAN
+    stats = db.get_prefetch_stats()
+    assert stats["by_status"] == {"ready": 2}
+    assert stats["unused_tokens"] == 2 * TOKENS_PER_LECTURE
+    assert db.get_lecture(program["id"], third) is None
+
+    assert prefetch.claim(db, program["id"], first) == {first: LECTURE}
+    assert prefetch.claim(db, program["id"], third) is None
+    assert db.get_prefetch_stats()["hits"] == 1
+    assert len(fake_ai) == 2
+
+def test_token_budget_skips_remaining_themes(db, program, fake_ai, monkeypatch):
+    monkeypatch.setattr(prefetch, "PREFETCH_CONCURRENCY", 1)
+    monkeypatch.setattr(prefetch, "PREFETCH_TOKEN_BUDGET", TOKENS_PER_LECTURE)
+    run_prefetch(db, program)
+    assert db.get_prefetch_stats()["by_status"] == {"ready": 1, "skipped": 1}
+    assert len(fake_ai) == 1
+
+def test_cancel_running_prefetch(db, program, fake_ai):
+    async def main():
+        prefetch.schedule(db, program, PLAN)
+        task = prefetch._running[program["id"]][1]
+        await asyncio.sleep(0)
+        prefetch.cancel_running(program["id"])
+        await asyncio.to_thread(db.cancel_prefetch, program["id"])
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert set(db.get_prefetch_stats()["by_status"]) == {"cancelled"}
+
+def test_only_plan_leader_schedules_prefetch(db, program, fake_ai):
+    scheduled = []
+
+    async def main():
+        return await asyncio.gather(*(
+            services.generate_course_plan(db, program, on_saved=scheduled.append) for _ in range(3)
+        ))
+
+    plans = asyncio.run(main())
+    assert fake_ai == ["generate_full_program"]
+    assert scheduled == [plans[0]]
+    assert plans[0] == plans[1] == plans[2]
@@ -0,0 +1,117 @@
+import asyncio
+import json
+
+import pytest
+
+import generate_ai
+import services
+from database.db import Database
+
+PLAN = {
+    "Тема 1: Введение": {"short_description": "Первая тема", "hours": 4},
+    "Тема 2: Основы": {"short_description": "Вторая тема", "hours": 6},
+    "Тема 3: Практика": {"short_description": "Третья тема", "hours": 8},
+    "literature": {"main": ["Учебник"]},
+}
+LECTURE = {"introduction": "Введение", "sections": [], "conclusion": "Заключение", "recommendations": []}
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / "test.db"))
+
+@pytest.fixture
+def program(db):
+    program_id = db.save_program("Курс", "Описание")
+    return {"id": program_id, "title": "Курс", "description": "Описание"}
+
+@pytest.fixture
+def ai_response(monkeypatch):
+    """Ответ ИИ на перегенерацию задаётся тестом: ai_response.append({...})"""
+    responses = []
+
+    async def fake_ai_generate(text, mode):
+        assert mode == "regenerate_themes"
+        return json.dumps(responses.pop(0), ensure_ascii=False)
+
+    monkeypatch.setattr(generate_ai, "_ai_generate", fake_ai_generate)
+    return responses
+
+def regenerate(db, program, themes, literature=False):
+    return asyncio.run(services.regenerate_themes(db, program, themes, literature))
+
+def test_regenerated_theme_replaces_only_itself(db, program, ai_response):
+    db.save_course_plan(program["id"], services.assign_theme_ids(json.loads(json.dumps(PLAN))))
+    before = db.get_course_plan(program["id"])
+    ai_response.append({"themes": [{"title": "Тема 2: Новые основы", "short_description": "Новая", "hours": 5}]})
+
+    plan = regenerate(db, program, ["Тема 2: Основы"])
+    assert list(plan) == ["Тема 1: Введение", "Тема 2: Новые основы", "Тема 3: Практика", "literature"]
+    assert plan["Тема 2: Новые основы"]["short_description"] == "Новая"
+    assert plan["Тема 2: Новые основы"]["theme_id"] != before["Тема 2: Основы"]["theme_id"]
+    assert plan["Тема 1: Введение"] == before["Тема 1: Введение"]
+    assert plan["literature"] == PLAN["literature"]
+    assert db.get_course_plan(program["id"]) == plan
+
+def test_legacy_lectures_are_linked_and_regenerated_theme_drops_its_lecture(db, program, ai_response):
+    # План и лекции, созданные до появления theme_id
+    db.save_course_plan(program["id"], PLAN)
+    for theme in ("Тема 1: Введение", "Тема 2: Основы"):
+        db.save_lecture(program["id"], theme, {theme: LECTURE})
+    ai_response.append({"themes": [{"title": "Тема 2: Основы", "short_description": "Новая"}]})
+
+    regenerate(db, program, ["Тема 2: Основы"])
+    assert db.get_lecture(program["id"], "Тема 1: Введение") == {"Тема 1: Введение": LECTURE}
+    # Тема с тем же названием получила новый theme_id и не подхватывает старую лекцию
+    assert db.get_lecture(program["id"], "Тема 2: Основы") is None
+    assert db.get_lecture_themes(program["id"]) == ["Тема 1: Введение"]
+
+    # Лекция привязана к теме по theme_id и переживает переименование темы
+    services.patch_course_plan(db, program["id"], [
+        {"op": "move", "from": "/Тема 1: Введение", "path": "/Тема 1: Вводная лекция"},
+    ])
+    assert db.get_lecture(program["id"], "Тема 1: Вводная лекция") == {"Тема 1: Введение": LECTURE}
+
+def test_title_clash_keeps_old_title(db, program, ai_response):
+    db.save_course_plan(program["id"], PLAN)
+    ai_response.append({"themes": [{"title": "Тема 3: Практика", "short_description": "Новая"}]})
+
+    plan = regenerate(db, program, ["Тема 2: Основы"])
+    assert plan["Тема 2: Основы"]["short_description"] == "Новая"
+    assert plan["Тема 3: Практика"]["short_description"] == "Третья тема"
+
+def test_literature_is_regenerated_on_request(db, program, ai_response):
+    db.save_course_plan(program["id"], PLAN)
+    ai_response.append({"themes": [], "literature": {"main": ["Новый учебник"]}})
+
+    plan = regenerate(db, program, [], literature=True)
+    assert plan["literature"] == {"main": ["Новый учебник"]}
+    assert plan["Тема 2: Основы"]["short_description"] == "Вторая тема"
+
+def test_wrong_theme_count_leaves_plan_unchanged(db, program, ai_response):
+    db.save_course_plan(program["id"], services.assign_theme_ids(json.loads(json.dumps(PLAN))))
+    before = db.get_course_plan(program["id"])
+    ai_response.append({"themes": [{"title": "А"}, {"title": "Б"}]})
+
+    with pytest.raises(ValueError):
+        regenerate(db, program, ["Тема 2: Основы"])
+    assert db.get_course_plan(program["id"]) == before
+
+def test_unknown_theme_is_rejected(db, program, ai_response):
+    db.save_course_plan(program["id"], PLAN)
+    with pytest.raises(ValueError):
+        regenerate(db, program, ["Нет такой темы"])
+    with pytest.raises(ValueError):
+        regenerate(db, program, [])
+
+@pytest.mark.parametrize("themes", ["Тема 1: Введение", [{"title": "Тема 1: Введение"}], ["Тема 1: Введение"] * 2])
+def test_route_rejects_malformed_theme_list(db, program, monkeypatch, themes):
+    import asgi
+
+    monkeypatch.setattr(asgi, "db", db)
+    db.save_course_plan(program["id"], PLAN)
+
+    async def post():
+        response = await asgi.app.test_client().post(f"/generate_course_plan/{program['id']}", json={"themes": themes})
+        return response.status_code
+
+    assert asyncio.run(post()) == 400
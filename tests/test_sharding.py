@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from database.codec import ZLIB, train_dictionary
+from database.db import Database
+from database.sharding import ShardedDatabase
+from database.split_shards import split
+
+PLAN = {"Тема 1": {"short_description": "Описание " * 200, "hours": 6}}
+LECTURE = {"Тема 1": {"introduction": "Введение " * 200, "sections": []}}
+
+@pytest.fixture
+def sharded(tmp_path):
+    return ShardedDatabase(str(tmp_path / "shards"), default_tenant="Общая")
+
+def open_shard_count(shards):
+    return sum(shard._connection._conn is not None for shard in shards)
+
+def test_programs_are_routed_to_tenant_shards(sharded):
+    physics = sharded.save_programs([("Механика", "Описание"), ("Оптика", "Описание")], tenant="Физика")
+    chemistry = sharded.save_program("Органика", "Описание", tenant="Химия")
+    common = sharded.save_program("Введение", "Описание")
+
+    # id программ глобальные: их выдаёт каталог
+    assert physics + [chemistry, common] == [1, 2, 3, 4]
+    assert os.path.exists(sharded.shard_path(sharded.catalog.get_tenant_id("Физика")))
+    assert sharded.get_program_by_id(chemistry)["title"] == "Органика"
+    assert [p["title"] for p in sharded.get_all_programs("Физика")] == ["Механика", "Оптика"]
+    assert sharded.get_all_programs("Нет такой кафедры") == []
+    assert [p["id"] for p in sharded.get_all_programs()] == [1, 2, 3, 4]
+    assert sharded.get_program_by_id(99) is None
+    with pytest.raises(ValueError):
+        sharded.save_course_plan(99, PLAN)
+
+def test_plans_lectures_and_prefetch_live_in_program_shard(sharded):
+    physics = sharded.save_program("Механика", "Описание", tenant="Физика")
+    chemistry = sharded.save_program("Органика", "Описание", tenant="Химия")
+    for program_id in (physics, chemistry):
+        sharded.save_course_plan(program_id, PLAN)
+    sharded.save_lectures([(physics, "Тема 1", LECTURE, None), (chemistry, "Тема 1", LECTURE, None)])
+
+    assert sharded.get_course_plan(chemistry) == PLAN
+    assert sharded.get_lecture(physics, "Тема 1") == LECTURE
+    assert sharded.get_lecture_themes(chemistry) == ["Тема 1"]
+    assert sharded.for_tenant("Физика").get_lecture(chemistry, "Тема 1") is None
+
+    sharded.start_prefetch(physics, ["Тема 1"])
+    sharded.start_prefetch(chemistry, ["Тема 1"])
+    assert sharded.claim_prefetch(physics, "Тема 1") == "pending"
+    assert sharded.get_prefetch_stats()["by_status"] == {"pending": 1, "skipped": 1}
+
+def test_lru_closes_evicted_shards(sharded):
+    sharded.max_open_shards = 1
+    seen = []
+    get_shard = sharded.get_shard
+
+    def recording_get_shard(tenant_id):
+        shard = get_shard(tenant_id)
+        seen.append(shard)
+        return shard
+
+    sharded.get_shard = recording_get_shard
+    ids = [sharded.save_programs([(f"{tenant} {i}", "Описание") for i in range(3)], tenant=tenant)
+           for tenant in ("А", "Б", "В")]
+    assert open_shard_count(set(seen)) == 1
+
+    # Слияние по шардам пачками по одной программе переключается между шардами
+    # на каждом шаге, но открытым остаётся только шард из кэша
+    assert [p["id"] for p in sharded.iter_programs(batch_size=1)] == sorted(sum(ids, []))
+    assert open_shard_count(set(seen)) == 1
+    assert sharded.get_program_by_id(ids[0][0])["title"] == "А 0"
+    assert open_shard_count(set(seen)) == 1
+
+def test_split_preserves_ids_and_routes_by_tenant_map(tmp_path, capsys):
+    source = Database(str(tmp_path / "programs.db"))
+    source.save_compression_dictionary(ZLIB, train_dictionary(
+        [("Описание " * i).encode("utf-8") for i in range(1, 100)], size=1024, algo=ZLIB))
+    ids = [source.save_program(f"Программа {i}", "Описание") for i in range(1, 4)]
+    for program_id in ids:
+        source.save_course_plan(program_id, PLAN)
+        source.save_lecture(program_id, "Тема 1", LECTURE)
+
+    shards_dir = str(tmp_path / "shards")
+    split(source.db_path, shards_dir, {ids[0]: "Физика", ids[2]: "Физика"}, "Общая")
+
+    sharded = ShardedDatabase(shards_dir)
+    assert [p["title"] for p in sharded.get_all_programs("Физика")] == ["Программа 1", "Программа 3"]
+    assert [p["title"] for p in sharded.get_all_programs("Общая")] == ["Программа 2"]
+    for program_id in ids:
+        assert sharded.get_course_plan(program_id) == PLAN
+        assert sharded.get_lecture(program_id, "Тема 1") == LECTURE
+    # Новые программы получают id после перенесённых
+    assert sharded.save_program("Новая", "Описание") == ids[-1] + 1
+
+    with pytest.raises(SystemExit):
+        split(source.db_path, shards_dir, {}, "Общая")
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import pytest
+
+import singleflight
+from database.db import Database
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / "test.db"))
+
+# --- Аренды в базе ---
+
+def test_lease_is_exclusive_until_released(db):
+    assert db.acquire_lease("key", "a", ttl=60)
+    assert not db.acquire_lease("key", "b", ttl=60)
+    assert db.get_lease("key")["owner"] == "a"
+
+    # Чужой владелец не может отпустить аренду
+    db.release_lease("key", "b")
+    assert not db.acquire_lease("key", "b", ttl=60)
+    db.release_lease("key", "a")
+    assert db.acquire_lease("key", "b", ttl=60)
+
+def test_expired_lease_is_taken_over(db):
+    assert db.acquire_lease("key", "a", ttl=-1)
+    assert db.acquire_lease("key", "b", ttl=60)
+    assert db.get_lease("key")["owner"] == "b"
+
+def test_renew_extends_only_own_running_lease(db):
+    db.acquire_lease("key", "a", ttl=1)
+    before = db.get_lease("key")["expires_at"]
+    db.renew_lease("key", "b", ttl=600)
+    assert db.get_lease("key")["expires_at"] == before
+    db.renew_lease("key", "a", ttl=600)
+    assert db.get_lease("key")["expires_at"] > time.time() + 500
+
+def test_completed_lease_publishes_result_and_is_taken_over(db):
+    db.acquire_lease("key", "a", ttl=60)
+    db.complete_lease("key", "a", {"Тема 1": {"introduction": "Введение"}}, ttl=60)
+    lease = db.get_lease("key")
+    assert lease["status"] == "done"
+    assert lease["result"] == {"Тема 1": {"introduction": "Введение"}}
+
+    # Новый запрос после завершения генерирует заново, а не получает старый результат
+    assert db.acquire_lease("key", "b", ttl=60)
+    lease = db.get_lease("key")
+    assert (lease["owner"], lease["status"], lease["result"]) == ("b", "running", None)
+
+# --- Схлопывание генераций (singleflight.run) ---
+
+def counting(result, delay=0.05):
+    """async-функция генерации, считающая свои вызовы"""
+    calls = []
+
+    async def func():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return result
+    return func, calls
+
+def test_make_key_depends_on_prompt():
+    key = singleflight.make_key("generate_lecture", 1, "Тема 1", ["промпт"])
+    assert key == singleflight.make_key("generate_lecture", 1, "Тема 1", ["промпт"])
+    assert key != singleflight.make_key("generate_lecture", 1, "Тема 1", ["другой промпт"])
+    assert key != singleflight.make_key("generate_lecture", 2, "Тема 1", ["промпт"])
+
+def test_concurrent_calls_share_one_generation(db):
+    func, calls = counting({"Тема 1": {"introduction": "Введение"}})
+
+    async def main():
+        return await asyncio.gather(*(singleflight.run(db, "key", func) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert results == [{"Тема 1": {"introduction": "Введение"}}] * 5
+
+def test_different_keys_run_separately(db):
+    func, calls = counting("результат")
+
+    async def main():
+        return await asyncio.gather(singleflight.run(db, "a", func), singleflight.run(db, "b", func))
+
+    assert asyncio.run(main()) == ["результат", "результат"]
+    assert len(calls) == 2
+
+def test_sequential_calls_generate_again(db):
+    func, calls = counting("результат", delay=0)
+    asyncio.run(singleflight.run(db, "key", func))
+    asyncio.run(singleflight.run(db, "key", func))
+    assert len(calls) == 2
+
+def test_leader_error_reaches_followers_and_releases_lease(db):
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise ValueError("ИИ вернул ответ в неверном формате")
+
+    async def main():
+        return await asyncio.gather(*(singleflight.run(db, "key", fail) for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert db.get_lease("key") is None
+
+def test_waits_for_leader_in_another_process(db, monkeypatch):
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_POLL_INTERVAL", 0.01)
+    # Аренду держит другой процесс
+    assert db.acquire_lease("key", "other", ttl=60)
+    func, calls = counting("свой результат", delay=0)
+
+    async def main():
+        follower = asyncio.create_task(singleflight.run(db, "key", func))
+        await asyncio.sleep(0.05)
+        db.complete_lease("key", "other", "результат лидера", ttl=60)
+        return await follower
+
+    assert asyncio.run(main()) == "результат лидера"
+    assert calls == []
+
+def test_takes_over_lease_of_crashed_process(db, monkeypatch):
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_POLL_INTERVAL", 0.01)
+    # Процесс-лидер упал и перестал продлевать аренду
+    assert db.acquire_lease("key", "crashed", ttl=0.05)
+    func, calls = counting("свой результат", delay=0)
+    assert asyncio.run(singleflight.run(db, "key", func)) == "свой результат"
+    assert len(calls) == 1
@@ -0,0 +1,27 @@
+import pytest
+
+import services
+from database.db import Database
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / "test.db"))
+
+# --- JSON Patch поверх базы ---
+
+def test_failed_test_op_leaves_stored_plan_unchanged(db):
+    program_id = db.save_program("Курс", "Описание")
+    plan = {"Тема 1": {"short_description": "Описание", "hours": 6}, "literature": {}}
+    db.save_course_plan(program_id, plan)
+
+    with pytest.raises(ValueError):
+        services.patch_theme(db, program_id, "Тема 1", [
+            {"op": "replace", "path": "/hours", "value": 8},
+            {"op": "test", "path": "/short_description", "value": "Другое"},
+        ])
+    assert Database(db.db_path).get_course_plan(program_id) == plan
+
+    theme = services.patch_theme(db, program_id, "Тема 1", [{"op": "replace", "path": "/hours", "value": 8}])
+    assert theme["hours"] == 8
+    assert db.get_course_plan(program_id)["Тема 1"]["hours"] == 8
+    assert services.patch_theme(db, program_id, "Нет такой темы", []) is None